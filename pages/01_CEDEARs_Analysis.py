@@ -1,14 +1,18 @@
+import time
+_page_start = time.perf_counter()  # time to first meaningful paint is measured from here
+
 import streamlit as st
 import pandas as pd
 import datetime
-import yfinance as yf
-import plotly.graph_objects as go
-from src import market_data, analysis
+from src import market_data, analysis, charting, snapshot, tracing
 import os
 
 # Page config
 st.set_page_config(page_title="CEDEARs Analysis", layout="wide")
 
+# Spans and counters of this rerun, for the performance panel
+trace = tracing.start_recording()
+
 st.title("CEDEARs Market Analysis")
 
 # --- Sidebar ---
@@ -44,72 +48,137 @@ else:
     selected_interval = "1d"
     analysis_period = "1y"
 
+# Extra benchmarks compared side by side in one batched computation
+selected_benchmarks = st.sidebar.multiselect("Compare Benchmarks", analysis.DEFAULT_BENCHMARKS, default=["GLD"],
+                                             help="CCL is the implied CCL rate (GGAL.BA x 10 / GGAL).")
+
+show_performance = st.sidebar.checkbox("Show Performance Panel", value=False,
+                                       help="Time spent per step and cache counters of the last rerun.")
+
 st.sidebar.markdown("---")
 st.sidebar.caption(
     "**Configuration Guide**:\n"
     "- **Select Date**: Choose the date to view daily performance (Gainers/Losers). If the date is a holiday/weekend, the latest available data is shown.\n"
-    "- **Refresh Data**: Clears the local cache (including disk cache) and forces a fresh download of market data from Yahoo Finance.\n"
-    "- **Analysis Type**: Switch between Short Term (Intraday/Daily) and Long Term (Historical) views."
+    "- **Refresh Data**: Downloads only the bars added since the last update (the latest session is re-fetched) for the tickers and intervals on this page, and merges them into the local cache.\n"
+    "- **Analysis Type**: Switch between Short Term (Intraday/Daily) and Long Term (Historical) views.\n"
+    "- **Show Performance Panel**: Breaks down where the last rerun spent its time (downloads, cache reads, computations, charts) and the memory held by the CEDEARs price panel."
 )
 
 # --- Data Loading ---
-@st.cache_data(ttl=3600, show_spinner="Fetching market data...")
+# cache_resource: every session gets the same read-only (memory-mapped) panel instead of its own copy
+@st.cache_resource(ttl=3600, show_spinner="Fetching market data...")
 def load_market_data():
     # 1. Load CEDEARs list
     csv_path = "data/cedears.csv"
     if not os.path.exists(csv_path):
         st.error(f"{csv_path} not found. Please run extract_cedears.py first.")
-        return None, None
+        return None, None, None
         
     try:
         df_cedears = pd.read_csv(csv_path)
         tickers = df_cedears['byma_code'].dropna().unique().tolist()
     except Exception as e:
         st.error(f"Error reading CEDEARs: {e}")
-        return None, None
+        return None, None, None
 
     # 2. Fetch Data for CEDEARs
-    # Fetch CEDEARs
-    df_cedears_data = market_data.fetch_batch_candles(tickers, period="1mo", interval="1d")
+    # Daily performance only needs Close, so only that column is read from the candle store (as float32).
+    cedears_panel = market_data.fetch_panel(tickers, period="1mo", interval="1d", fields=["Close"],
+                                            precision=analysis.UNIVERSE_PRECISION)
+
+    # 3. Change matrix for every date, so picking a date is a lookup
+    daily_changes = analysis.compute_daily_changes(cedears_panel)
+
+    # 4. Last-known-good copy for the next cold start
+    snapshot.save_snapshot(cedears_panel)
     
-    return df_cedears_data, tickers
+    return cedears_panel, tickers, daily_changes
+
+# Process-wide page state: whether load_market_data has completed in this process
+@st.cache_resource
+def page_state():
+    return {"warm": False}
+
+def report_first_paint(source: str):
+    """Records (once per session) how long the first meaningful paint took, and logs it."""
+    if "first_paint" in st.session_state:
+        return
+    elapsed = time.perf_counter() - _page_start
+    st.session_state["first_paint"] = (elapsed, source)
+    print(f"First paint after {elapsed:.3f}s ({source})")
+
+def render_daily_performance(daily_changes, note: str = ""):
+    st.header(f"Daily Performance")
+    # Always emitted, so the fresh tables replace the snapshot's element for element
+    st.caption(note)
+
+    df_gainers, df_losers = analysis.top_movers(daily_changes, selected_date, n=5)
+
+    if not df_gainers.empty:
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("Top 5 Gainers 🚀")
+            st.dataframe(
+                df_gainers
+                .style.format({"Close": "{:.2f}", "Prev Close": "{:.2f}", "Change %": "{:+.2f}%"})
+            )
+            
+        with col2:
+            st.subheader("Top 5 Losers 🔻")
+            st.dataframe(
+                df_losers
+                .style.format({"Close": "{:.2f}", "Prev Close": "{:.2f}", "Change %": "{:+.2f}%"})
+            )
+    else:
+         st.info("No valid price changes found or insufficient data.")
 
-data_state = st.text("Loading data...")
-df_prices, tickers_list = load_market_data()
+# Every lag from -10 to +10 in one pass, so changing the lag input is a column lookup
+@st.cache_data(ttl=300, show_spinner=False)
+def load_lag_correlations(tickers: tuple, period: str, interval: str):
+    return analysis.calculate_lag_correlations(list(tickers), benchmark_ticker="GLD", period=period, interval=interval, lags=range(-10, 11))
+
+# Trailing-window correlation of the whole universe, for the "over time" chart
+@st.cache_data(ttl=300, show_spinner=False)
+def load_rolling_correlations(tickers: tuple, window: int, lag: int):
+    return analysis.calculate_rolling_correlations(list(tickers), benchmark_ticker="GLD", window=window, period="1y", interval="1d", lag=lag)
+
+# --- Daily Performance Section ---
+# While this process has not loaded data yet, render the last snapshot first
+# and swap in the fresh tables when they arrive.
+performance_area = st.empty()
+if not page_state()["warm"] and not refresh_btn:
+    last_good = snapshot.load_snapshot()
+    if last_good is not None:
+        snapshot_panel, saved_at = last_good
+        with performance_area.container():
+            render_daily_performance(analysis.compute_daily_changes(snapshot_panel),
+                                     note=f"Snapshot from {saved_at:%Y-%m-%d %H:%M} UTC, refreshing...")
+        report_first_paint("snapshot")
 
-if refresh_btn:
-    st.cache_data.clear()
-    market_data.clear_cache()
-    df_prices, tickers_list = load_market_data()
+data_state = st.text("Loading data...")
+df_prices, tickers_list, daily_changes = load_market_data()
+page_state()["warm"] = True
+
+if refresh_btn and tickers_list:
+    # Only the tickers and intervals on this page go stale; other cached data stays.
+    refreshed = tickers_list + analysis.benchmark_tickers(["GLD"] + selected_benchmarks)
+    market_data.invalidate(refreshed, intervals=["1d", selected_interval])
+    load_market_data.clear()
+    load_lag_correlations.clear()
+    load_rolling_correlations.clear()
+    df_prices, tickers_list, daily_changes = load_market_data()
 data_state.empty()
 
 if df_prices is None or df_prices.empty:
     st.warning("No data available.")
     st.stop()
 
-# --- Daily Performance Section ---
-st.header(f"Daily Performance")
-
-df_performance = analysis.get_daily_performance(df_prices, selected_date)
-
-if not df_performance.empty:
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.subheader("Top 5 Gainers 🚀")
-        st.dataframe(
-            df_performance.sort_values("Change %", ascending=False).head(5)
-            .style.format({"Close": "{:.2f}", "Prev Close": "{:.2f}", "Change %": "{:+.2f}%"})
-        )
-        
-    with col2:
-        st.subheader("Top 5 Losers 🔻")
-        st.dataframe(
-            df_performance.sort_values("Change %", ascending=True).head(5)
-            .style.format({"Close": "{:.2f}", "Prev Close": "{:.2f}", "Change %": "{:+.2f}%"})
-        )
-else:
-     st.info("No valid price changes found or insufficient data.")
+with performance_area.container():
+    render_daily_performance(daily_changes)
+report_first_paint("fresh data")
+first_paint, first_paint_source = st.session_state["first_paint"]
+st.sidebar.caption(f"First paint: {first_paint * 1000:.0f} ms ({first_paint_source})")
 
 
 # --- Correlation Section ---
@@ -159,10 +228,15 @@ try:
     with st.spinner(f"Fetching {selected_interval} data for correlation..."):
         # We need the list of tickers again.
         if tickers_list:
+             lag_correlations = load_lag_correlations(tuple(tickers_list), analysis_period, selected_interval)
              if analysis_type == "Short Term (Intraday)":
-                corr_df = analysis.calculate_correlations(tickers_list, benchmark_ticker="GLD", period=analysis_period, interval=selected_interval, lag=correlation_lag)
+                corr_df = analysis.correlations_at_lag(lag_correlations, correlation_lag)
              else:
                 corr_df = analysis.calculate_multi_period_correlations(tickers_list, benchmark_ticker="GLD", lag=correlation_lag)
+
+             # Strongest lag per ticker over the whole -10..+10 range
+             if not corr_df.empty:
+                corr_df = corr_df.merge(analysis.best_lags(lag_correlations), on="Ticker", how="left")
              
              if not corr_df.empty:
                 # Initialize session state for selected tickers if not exists
@@ -189,15 +263,24 @@ try:
                             ),
                             "Correlation": st.column_config.NumberColumn(
                                 format="%.4f"
+                            ),
+                            "Best Lag": st.column_config.NumberColumn(
+                                format="%+d",
+                                help="Lag (-10..+10) with the strongest correlation for this ticker"
+                            ),
+                            "Best Corr": st.column_config.NumberColumn(
+                                format="%.4f"
                             )
                         },
-                        disabled=["Ticker", "Correlation", "1M", "3M", "6M", "1Y"],
+                        disabled=["Ticker", "Correlation", "1M", "3M", "6M", "1Y", "Best Lag", "Best Corr"],
                         hide_index=True,
                         width="stretch"
                     )
                     
                     # Graph Config (Moved to bottom)
                     graph_metric = st.radio("Graph Metric", ["Cumulative Return (%)", "Candle Return (%)"], horizontal=True)
+                    graph_detail = st.select_slider("Points per Series", options=[250, 500, 1000, 2000, "All"], value=charting.DEFAULT_POINT_BUDGET,
+                                                    help="Long series are downsampled to this many points and drawn with WebGL. 'All' draws every bar.")
 
                     update_graph = st.form_submit_button("Update Graph")
                 
@@ -212,91 +295,78 @@ try:
                         
                         with st.spinner("Preparing graph..."):
                             
-                            # Helper to process data based on metric
-                            def get_series_data(df, metric, analysis_type_param):
-                                if df.empty: return None
-                                
-                                closes = analysis._get_close_data(df)
-                                if isinstance(closes, pd.DataFrame): closes = closes.iloc[:,0]
-                                
-                                if metric == "Candle Return (%)":
-                                    opens = analysis._get_open_data(df)
-                                    if isinstance(opens, pd.DataFrame): opens = opens.iloc[:,0]
-                                    return analysis.calculate_candle_return(opens, closes)
-                                else:
-                                    # Cumulative Return
-                                    baseline = None
-                                    if analysis_type_param == "Historical (Long Term)":
-                                        opens = analysis._get_open_data(df)
-                                        if isinstance(opens, pd.DataFrame): opens = opens.iloc[:,0]
-                                        if not opens.empty:
-                                            baseline = opens.iloc[0]
-                                    
-                                    return analysis.normalize_to_pct_change(closes, baseline=baseline)
-
-                            # Fetch GLD (Benchmark)
-                            df_gold_bench = analysis.market_data.fetch_candles("GLD", period=analysis_period, interval=selected_interval)
-                            comparison_data = pd.DataFrame()
-                            
-                            s_gld = get_series_data(df_gold_bench, graph_metric, analysis_type)
-                            if s_gld is not None:
-                                comparison_data["GLD"] = s_gld
-                            
-                            # Fetch and Normalize Selected Tickers
-                            for ticker in selected_tickers:
-                                df_t = analysis.market_data.fetch_candles(ticker, period=analysis_period, interval=selected_interval, suffix="")
-                                s_t = get_series_data(df_t, graph_metric, analysis_type)
-                                if s_t is not None:
-                                    comparison_data[ticker] = s_t
+                            open_baseline = analysis_type == "Historical (Long Term)"
+
+                            # Slice GLD (Benchmark) and the selected tickers out of the panels the
+                            # correlation step already loaded into memory: no extra I/O.
+                            gold_panel = analysis.market_data.fetch_panel(["GLD"], period=analysis_period, interval=selected_interval)
+                            universe_panel = analysis.load_universe_panel(tickers_list, period=analysis_period, interval=selected_interval)
+                            comparison_data = pd.concat([
+                                analysis.comparison_frame(gold_panel, ["GLD"], graph_metric, open_baseline),
+                                analysis.comparison_frame(universe_panel, selected_tickers, graph_metric, open_baseline),
+                            ], axis=1)
                             
                             if not comparison_data.empty:
                                 # Remove rows with NaN only if ALL series are NaN
                                 # This ensures that if GLD has data but a Ticker doesn't (or vice versa), we still show the data that exists.
                                 comparison_data.dropna(how='all', inplace=True)
                                 
-                                # Convert index to string to avoid showing time gaps (weekend/holidays/market close) on the chart
-                                # This creates a "Categorical" axis which naturally skips missing periods.
-                                # Format depends on interval: Date for daily, Date+Time for intraday
-                                if "d" in selected_interval:
-                                    x_values = comparison_data.index.strftime("%Y-%m-%d")
+                                if graph_detail != "All":
+                                    # Downsampled WebGL traces on an integer (gap-free) axis; no per-bar date strings.
+                                    # Candle returns are spiky, so keep each bucket's min and max instead of LTTB.
+                                    fig = charting.comparison_figure(
+                                        comparison_data,
+                                        y_title=graph_metric,
+                                        intraday="d" not in selected_interval,
+                                        point_budget=graph_detail,
+                                        method="minmax" if graph_metric == "Candle Return (%)" else "lttb",
+                                    )
                                 else:
-                                    x_values = comparison_data.index.strftime("%Y-%m-%d %H:%M")
-
-                                # Plotly Logic
-                                fig = go.Figure()
+                                    # Convert index to string to avoid showing time gaps (weekend/holidays/market close) on the chart
+                                    # This creates a "Categorical" axis which naturally skips missing periods.
+                                    # Format depends on interval: Date for daily, Date+Time for intraday
+                                    if "d" in selected_interval:
+                                        x_values = comparison_data.index.strftime("%Y-%m-%d")
+                                    else:
+                                        x_values = comparison_data.index.strftime("%Y-%m-%d %H:%M")
+
+                                    # Plotly Logic (imported on first use, so the first paint does not wait for it)
+                                    import plotly.graph_objects as go
+                                    fig = go.Figure()
                                 
-                                # Add traces
-                                for col in comparison_data.columns:
-                                    fig.add_trace(go.Scatter(
-                                        x=x_values, # Use string values
-                                        y=comparison_data[col],
-                                        mode='lines',
-                                        name=col,
-                                        connectgaps=True 
-                                    ))
+                                    # Add traces
+                                    for col in comparison_data.columns:
+                                        fig.add_trace(go.Scatter(
+                                            x=x_values, # Use string values
+                                            y=comparison_data[col],
+                                            mode='lines',
+                                            name=col,
+                                            connectgaps=True 
+                                        ))
                                 
-                                # Layout Configuration
-                                fig.update_layout(
-                                    title="Performance Comparison",
-                                    xaxis_title="Date",
-                                    yaxis_title=graph_metric,
-                                    height=600,
-                                    hovermode="x unified",
-                                    xaxis=dict(
-                                        type='category', # Force category axis
-                                        rangeslider=dict(visible=True),
-                                        tickmode='auto',
-                                        nticks=20 # Limit ticks to avoid crowding
+                                    # Layout Configuration
+                                    fig.update_layout(
+                                        title="Performance Comparison",
+                                        xaxis_title="Date",
+                                        yaxis_title=graph_metric,
+                                        height=600,
+                                        hovermode="x unified",
+                                        xaxis=dict(
+                                            type='category', # Force category axis
+                                            rangeslider=dict(visible=True),
+                                            tickmode='auto',
+                                            nticks=20 # Limit ticks to avoid crowding
+                                        )
                                     )
-                                )
 
-                                # No need for rangebreaks since we are using categorical axis (gaps don't exist in the data list)
+                                    # No need for rangebreaks since we are using categorical axis (gaps don't exist in the data list)
 
                                 # Using width="stretch" per deprecation warning recommendation for use_container_width=True
                                 # However, st.plotly_chart documentation might not have updated signature in all versions. 
                                 # If it fails, I'll revert. But user log showed the warning explicitly.
                                 try:
-                                    st.plotly_chart(fig, on_select="ignore", selection_mode="points") # new params?
+                                    with tracing.span("page.plotly_chart", traces=len(fig.data)):
+                                        st.plotly_chart(fig, on_select="ignore", selection_mode="points") # new params?
                                     # Actually, let's stick to simple first, but address the warning if possible.
                                     # The warning said "For use_container_width=True, use width='stretch'".
                                     # Current Streamlit versions allow: st.plotly_chart(fig, ...)
@@ -308,7 +378,8 @@ try:
                                     # Or try passing the configuration in `config`.
                                     
                                     # Let's try generic approach:
-                                    st.plotly_chart(fig, use_container_width=True)
+                                    with tracing.span("page.plotly_chart", traces=len(fig.data)):
+                                        st.plotly_chart(fig, use_container_width=True)
                                 except TypeError:
                                      st.plotly_chart(fig)
 
@@ -321,3 +392,119 @@ try:
 
 except Exception as e:
     st.error(f"Error processing correlation: {e}")
+
+
+# --- Multi-Benchmark Correlation ---
+if tickers_list and len(selected_benchmarks) > 1:
+    st.divider()
+    st.header("Correlation with Benchmarks")
+    st.caption(f"Lag: {correlation_lag} | Correlation of Benchmark(t) vs Ticker(t+{correlation_lag}), {selected_interval} bars over {analysis_period}")
+    try:
+        with st.spinner("Correlating against benchmarks..."):
+            df_bench_corr = analysis.calculate_benchmark_correlations(tickers_list, benchmarks=selected_benchmarks, period=analysis_period, interval=selected_interval, lag=correlation_lag)
+        if not df_bench_corr.empty:
+            df_bench_corr = df_bench_corr.dropna(how="all").sort_values(df_bench_corr.columns[0], ascending=False)
+            st.dataframe(
+                df_bench_corr,
+                column_config={b: st.column_config.NumberColumn(format="%.4f") for b in df_bench_corr.columns},
+                width="stretch"
+            )
+        else:
+            st.warning("No overlapping data found for the selected benchmarks.")
+    except Exception as e:
+        st.error(f"Error processing benchmark correlations: {e}")
+
+
+# --- Correlation Over Time ---
+if analysis_type == "Historical (Long Term)" and tickers_list:
+    st.divider()
+    st.header("Correlation with Gold (GLD) - Over Time")
+    window_label = st.radio("Rolling Window", list(analysis.CORRELATION_WINDOWS), index=1, horizontal=True)
+    st.caption(f"Each point is the correlation over the previous {analysis.CORRELATION_WINDOWS[window_label]} trading days. Lag: {correlation_lag}")
+
+    try:
+        df_rolling = load_rolling_correlations(tuple(tickers_list), analysis.CORRELATION_WINDOWS[window_label], correlation_lag)
+        if not df_rolling.empty:
+            # Universe distribution per date: median and interquartile band
+            quartiles = df_rolling.quantile([0.25, 0.5, 0.75], axis=1).T
+            x_values = df_rolling.index.strftime("%Y-%m-%d")
+
+            import plotly.graph_objects as go
+            fig_rolling = go.Figure()
+            fig_rolling.add_trace(go.Scatter(x=x_values, y=quartiles[0.75], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig_rolling.add_trace(go.Scatter(x=x_values, y=quartiles[0.25], mode='lines', line=dict(width=0), fill='tonexty', name="Universe 25-75%"))
+            fig_rolling.add_trace(go.Scatter(x=x_values, y=quartiles[0.5], mode='lines', name="Universe Median"))
+
+            # Tickers selected for the comparison graph
+            for ticker in st.session_state.get("selected_tickers_graph", []):
+                if ticker in df_rolling.columns:
+                    fig_rolling.add_trace(go.Scatter(x=x_values, y=df_rolling[ticker], mode='lines', name=ticker, connectgaps=True))
+
+            fig_rolling.update_layout(
+                xaxis_title="Date",
+                yaxis_title="Correlation",
+                yaxis=dict(range=[-1, 1]),
+                height=450,
+                hovermode="x unified",
+                xaxis=dict(type='category', tickmode='auto', nticks=20)
+            )
+            with tracing.span("page.plotly_chart", traces=len(fig_rolling.data)):
+                st.plotly_chart(fig_rolling, width="stretch")
+        else:
+            st.warning("No overlapping data found for Correlation.")
+    except Exception as e:
+        st.error(f"Error processing rolling correlation: {e}")
+
+
+# --- Universe Correlation Matrix ---
+if tickers_list:
+    st.divider()
+    st.header("Universe Correlation Matrix")
+    if st.checkbox("Show correlation heatmap (all tickers, clustered)", value=False):
+        matrix_window = None
+        if analysis_type == "Historical (Long Term)":
+            matrix_label = st.radio("Matrix Window", list(analysis.CORRELATION_WINDOWS), index=1, horizontal=True, key="matrix_window")
+            matrix_window = analysis.CORRELATION_WINDOWS[matrix_label]
+        st.caption("Correlation of per-bar returns between every pair of tickers, ordered by hierarchical clustering so correlated tickers form blocks.")
+
+        try:
+            with st.spinner("Computing correlation matrix..."):
+                df_matrix = analysis.calculate_correlation_matrix(tickers_list, period=analysis_period, interval=selected_interval, window=matrix_window)
+            if not df_matrix.empty:
+                import plotly.graph_objects as go
+                fig_matrix = go.Figure(go.Heatmap(
+                    z=df_matrix.values,
+                    x=df_matrix.columns,
+                    y=df_matrix.index,
+                    zmin=-1,
+                    zmax=1,
+                    colorscale="RdBu",
+                    reversescale=True
+                ))
+                fig_matrix.update_layout(
+                    height=800,
+                    yaxis=dict(autorange="reversed"),
+                    xaxis=dict(showticklabels=len(df_matrix) <= 100),
+                )
+                with tracing.span("page.plotly_chart", traces=len(fig_matrix.data)):
+                    st.plotly_chart(fig_matrix, width="stretch")
+            else:
+                st.warning("Not enough data for the correlation matrix.")
+        except Exception as e:
+            st.error(f"Error processing correlation matrix: {e}")
+
+
+# --- Performance Panel ---
+if show_performance:
+    with st.sidebar.expander("Performance (this rerun)", expanded=True):
+        st.caption(f"{trace.elapsed * 1000:.0f} ms in this rerun. Cached steps that were skipped do not appear.")
+        st.dataframe(trace.spans(), hide_index=True, width="stretch",
+                     column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ["Total ms", "Self ms"]})
+        st.dataframe(trace.counters(), hide_index=True, width="stretch")
+        for message in trace.errors():
+            st.warning(message)
+        memory = df_prices.memory_report()
+        memory["Shape"] = memory["Shape"].map(lambda shape: " x ".join(map(str, shape)))
+        st.caption(f"CEDEARs panel: {memory['Bytes'].iloc[-1] / 2 ** 20:.1f} MB")
+        st.dataframe(memory, hide_index=True, width="stretch")
+        st.download_button("Export (JSON lines)", trace.to_jsonl(), file_name="trace.jsonl", mime="application/jsonl")
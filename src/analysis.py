@@ -1,188 +1,458 @@
+import threading
+
+import numpy as np
 import pandas as pd
-import yfinance as yf
-from src import market_data
+from typing import NamedTuple, Optional
+
+from src import correlation, market_data, tracing
+from src.memory_cache import ByteLRUCache
+from src.price_panel import PricePanel
+from src.result_cache import memoize
+
+class DailyChanges(NamedTuple):
+    """Close-to-close changes for every ticker and every date (rows: dates, columns: tickers)."""
+    dates: pd.DatetimeIndex
+    tickers: np.ndarray
+    close: np.ndarray
+    prev_close: np.ndarray
+    change_pct: np.ndarray
+
+
+def _as_panel(data) -> Optional[PricePanel]:
+    """Analysis inputs are PricePanels; DataFrames are accepted (and copied) for older callers."""
+    if data is None or isinstance(data, PricePanel):
+        return data
+    return PricePanel.from_frame(data)
+
+
+@tracing.traced
+def compute_daily_changes(prices) -> Optional[DailyChanges]:
+    """
+    Computes the change matrix of all tickers for all dates in one pass.
+    `prices` is a PricePanel (or a DataFrame with Close prices).
+    The previous close of a date is the close of the previous available date,
+    so a ticker missing on either date has no change (NaN) for it.
+    Returns None if there are no Close prices.
+    """
+    panel = _as_panel(prices)
+    if panel is None or panel.empty or "Close" not in panel.fields:
+        return None
+
+    dates = panel.index.normalize()
+    close = np.asarray(panel.field("Close"), dtype=np.float64)  # changes in full precision for compact panels
+    if not (dates.is_monotonic_increasing and dates.is_unique):
+        # One row per date (the last one, if the index was intraday).
+        order = np.argsort(dates.values, kind="stable")
+        dates, close = dates[order], close[order]
+        last = np.append(dates.values[1:] != dates.values[:-1], True)
+        dates, close = dates[last], close[last]
+
+    prev_close = np.full_like(close, np.nan)
+    prev_close[1:] = close[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change_pct = (close / prev_close - 1) * 100
+    change_pct[~np.isfinite(change_pct) | (prev_close == 0)] = np.nan
+    return DailyChanges(dates, np.array(panel.tickers, dtype=object), close, prev_close, change_pct)
+
+
+def _effective_row(changes: DailyChanges, target_date) -> Optional[int]:
+    """Row of `target_date`, or of the latest date if it is not available (holiday/weekend)."""
+    if len(changes.dates) == 0:
+        return None
+    target_date = pd.Timestamp(target_date).normalize()
+    loc = changes.dates.searchsorted(target_date)
+    if loc < len(changes.dates) and changes.dates[loc] == target_date:
+        return loc
+    return len(changes.dates) - 1
+
+
+def _performance_frame(changes: DailyChanges, row: int, cols: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Ticker": changes.tickers[cols],
+        "Close": changes.close[row, cols],
+        "Prev Close": changes.prev_close[row, cols],
+        "Change %": changes.change_pct[row, cols],
+    })
 
-def get_daily_performance(df_prices: pd.DataFrame, target_date: pd.Timestamp) -> pd.DataFrame:
+
+@tracing.traced
+def top_movers(changes: Optional[DailyChanges], target_date, n: int = 5) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Top `n` gainers and losers on `target_date` (or the latest date), each
+    sorted from the largest move. Selection is a partial partition, O(tickers).
+    """
+    row = _effective_row(changes, target_date) if changes is not None else None
+    if row is None:
+        return pd.DataFrame(), pd.DataFrame()
+
+    valid = np.flatnonzero(~np.isnan(changes.change_pct[row]))
+    values = changes.change_pct[row, valid]
+    k = min(n, len(values))
+    if k == 0:
+        return pd.DataFrame(), pd.DataFrame()
+
+    movers = []
+    for sign in (-1, 1):  # gainers: largest first; losers: smallest first
+        keyed = sign * values
+        top = np.argpartition(keyed, k - 1)[:k] if k < len(values) else np.arange(len(values))
+        top = top[np.argsort(keyed[top], kind="stable")]
+        movers.append(_performance_frame(changes, row, valid[top]))
+    return movers[0], movers[1]
+
+
+@tracing.traced
+def get_daily_performance(prices, target_date: pd.Timestamp,
+                          changes: Optional[DailyChanges] = None) -> pd.DataFrame:
     """
-    Calculates the daily performance (Close price change) for all tickers in df_prices.
+    Calculates the daily performance (Close price change) for all tickers in `prices`.
     
     Args:
-        df_prices: DataFrame with datetime index and ticker columns (or MultiIndex).
-                   Expected to contain 'Close' prices or allow extraction of them.
+        prices: PricePanel, or DataFrame with datetime index and ticker columns (or MultiIndex)
+                containing 'Close' prices.
         target_date: The date to calculate performance for.
+        changes: Precomputed compute_daily_changes(prices), so that changing
+                 the date is a lookup.
         
     Returns:
         DataFrame with columns ['Ticker', 'Close', 'Prev Close', 'Change %']
     """
-    if df_prices is None or df_prices.empty:
+    if changes is None:
+        changes = compute_daily_changes(prices)
+    row = _effective_row(changes, target_date) if changes is not None else None
+    if row is None:
         return pd.DataFrame()
 
-    # robust close extraction (reused from previous dashboard logic)
-    close_data = _get_close_data(df_prices)
-    
-    if close_data.empty:
+    cols = np.flatnonzero(~np.isnan(changes.change_pct[row]))
+    if len(cols) == 0:
         return pd.DataFrame()
+    return _performance_frame(changes, row, cols)
 
-    # Normalize dates
-    close_data.index = pd.to_datetime(close_data.index).normalize()
-    target_date = pd.Timestamp(target_date).normalize()
-    
-    available_dates = close_data.index.sort_values(ascending=False)
-    
-    # Check if target_date exists, if not, find latest
-    effective_date = target_date
-    if target_date not in available_dates:
-        if not available_dates.empty:
-            effective_date = available_dates[0]
+
+def _benchmarks_on_axis(panel: PricePanel, benchmark: PricePanel) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Benchmark Closes (one column per benchmark) on the panel's timestamp axis,
+    NaN where a benchmark has no bar, and the mask of panel rows that have a
+    benchmark row, i.e. the rows an inner join of the two would keep.
+    """
+    closes = benchmark.field("Close")
+    if panel.index.equals(benchmark.index):
+        return closes, np.ones(len(panel.index), dtype=bool)
+    rows = benchmark.index.get_indexer(panel.index)
+    present = rows >= 0
+    on_axis = np.full((len(panel.index), closes.shape[1]), np.nan)
+    on_axis[present] = closes[rows[present]]
+    return on_axis, present
+
+
+def _benchmark_on_axis(panel: PricePanel, benchmark: PricePanel) -> tuple[np.ndarray, np.ndarray]:
+    """Single-benchmark version of _benchmarks_on_axis (first benchmark column)."""
+    on_axis, present = _benchmarks_on_axis(panel, benchmark)
+    return on_axis[:, 0], present
+
+
+def _shifted(values: np.ndarray, lag: int) -> np.ndarray:
+    """Row t holds values[t+lag] (like DataFrame.shift(-lag)); NaN past either end."""
+    if lag == 0:
+        return values
+    out = np.full(values.shape, np.nan, order="F")
+    if abs(lag) < len(values):
+        if lag > 0:
+            out[:-lag] = values[lag:]
         else:
-            return pd.DataFrame() # No dates available
+            out[-lag:] = values[:lag]
+    return out
 
-    # Find previous date
-    if effective_date not in available_dates:
-        return pd.DataFrame() # Should not happen if we picked from available
-        
-    loc = available_dates.get_loc(effective_date)
-    
-    stats = []
-    
-    if loc + 1 < len(available_dates):
-        prev_dt = available_dates[loc + 1]
-        
-        for ticker in close_data.columns:
-            try:
-                close_today = close_data.loc[effective_date, ticker]
-                close_prev = close_data.loc[prev_dt, ticker]
-                
-                if pd.notna(close_today) and pd.notna(close_prev) and close_prev != 0:
-                    pct_change = (close_today - close_prev) / close_prev
-                    stats.append({
-                        "Ticker": ticker,
-                        "Close": close_today,
-                        "Prev Close": close_prev,
-                        "Change %": pct_change * 100
-                    })
-            except Exception:
-                continue
-    
-    return pd.DataFrame(stats)
 
+# Fields loaded for the ticker universe: Close for the correlations, Open for
+# the comparison graph. Every analysis asks for the same fields, so one panel
+# per (universe, interval, period) serves all of them from the memory tier.
+UNIVERSE_FIELDS = ["Open", "Close"]
+# float32 prices: half the memory, and well within the precision of quoted
+# prices; the correlation kernels accumulate in float64.
+UNIVERSE_PRECISION = "compact"
+
+@tracing.traced
+def load_universe_panel(tickers: list, period: str = "5d", interval: str = "1h") -> PricePanel:
+    """The shared universe panel (see UNIVERSE_FIELDS and UNIVERSE_PRECISION)."""
+    return market_data.fetch_panel(tickers, period=period, interval=interval, fields=UNIVERSE_FIELDS,
+                                   precision=UNIVERSE_PRECISION)
+
+
+def _load_correlation_panels(tickers: list, benchmark_ticker: str, period: str, interval: str):
+    """Universe panel of the tickers and the full benchmark panel (shared with the comparison graph)."""
+    panel = load_universe_panel(tickers, period=period, interval=interval)
+    # No suffix, so we get the US ticker if requested (pass suffix=".BA" for the CEDEAR).
+    # The prompt implied using "GLD" (US) for "Gold Price".
+    benchmark = market_data.fetch_panel([benchmark_ticker], period=period, interval=interval)
+    return panel, benchmark
+
+
+@tracing.traced
+def calculate_lag_correlations(tickers: list, benchmark_ticker: str = "GLD", period: str = "5d", interval: str = "1h",
+                               lags=range(-10, 11)) -> pd.DataFrame:
+    """
+    Correlation of Benchmark(t) with Ticker(t+lag) for every ticker and every
+    lag in `lags`, computed in one pass.
+    Returns a DataFrame indexed by Ticker with one column per lag.
+    """
+    panel, benchmark = _load_correlation_panels(tickers, benchmark_ticker, period, interval)
+    return lag_correlation_matrix(panel, benchmark, list(lags))
+
+@memoize
+def lag_correlation_matrix(panel: PricePanel, benchmark: PricePanel, lags: list) -> pd.DataFrame:
+    """calculate_lag_correlations over already loaded panels (memoized on their fingerprints)."""
+    if panel.empty or benchmark.empty:
+        return pd.DataFrame()
+
+    bench, _ = _benchmark_on_axis(panel, benchmark)
+    matrix = correlation.lag_scan(panel.field("Close"), bench, lags)
+    return pd.DataFrame(matrix, index=pd.Index(panel.tickers, name="Ticker"), columns=lags)
+
+def correlations_at_lag(lag_correlations: pd.DataFrame, lag: int = 0) -> pd.DataFrame:
+    """One lag of a calculate_lag_correlations matrix, as the ['Ticker', 'Correlation'] table."""
+    if lag_correlations.empty or lag not in lag_correlations.columns:
+        return pd.DataFrame()
+    corr_df = lag_correlations[lag].rename("Correlation").reset_index()
+    return corr_df.dropna().sort_values('Correlation', ascending=False)
+
+def best_lags(lag_correlations: pd.DataFrame) -> pd.DataFrame:
+    """
+    Lag with the strongest correlation (largest absolute value) per ticker.
+    Returns columns ['Ticker', 'Best Lag', 'Best Corr'].
+    """
+    if lag_correlations.empty:
+        return pd.DataFrame(columns=["Ticker", "Best Lag", "Best Corr"])
+    values = lag_correlations.to_numpy()
+    best = np.where(np.isnan(values), -1.0, np.abs(values)).argmax(axis=1)
+    best_corr = values[np.arange(len(values)), best]
+    best_lag = np.asarray(lag_correlations.columns, dtype=float)[best]
+    best_lag[np.isnan(best_corr)] = np.nan
+    return pd.DataFrame({"Ticker": lag_correlations.index, "Best Lag": best_lag, "Best Corr": best_corr})
+
+@tracing.traced
 def calculate_correlations(tickers: list, benchmark_ticker: str = "GLD", period: str = "5d", interval: str = "1h", lag: int = 0) -> pd.DataFrame:
     """
     Fetches data for tickers and benchmark, and calculates correlation.
     If lag > 0, checks if Benchmark(t) correlates with Ticker(t+lag).
     """
-    # Fetch CEDEARs
-    df_cedears = market_data.fetch_batch_candles(tickers, period=period, interval=interval)
-    
-    # Fetch Benchmark (e.g. GLD US)
-    # We use yf.download directly for the benchmark to ensure we get the US ticker if requested,
-    # or we could use market_data if we wanted .BA suffix. 
-    # The prompt implied using "GLD" (US) for "Gold Price".
-    df_benchmark = yf.download(benchmark_ticker, period=period, interval=interval, auto_adjust=False, progress=False)
-    
-    cedear_closes = _get_close_data(df_cedears)
-    benchmark_closes = _get_close_data(df_benchmark)
-    
-    if benchmark_closes.empty:
-        return pd.DataFrame()
-        
-    # Benchmark might be DataFrame or Series. Ensure Series.
-    if isinstance(benchmark_closes, pd.DataFrame):
-         # Take first col
-         benchmark_series = benchmark_closes.iloc[:, 0]
-    else:
-         benchmark_series = benchmark_closes
-
-    benchmark_series = benchmark_series.rename(benchmark_ticker)
-    
-    if cedear_closes.empty:
-        return pd.DataFrame()
-        
-    benchmark_series = benchmark_series.rename(benchmark_ticker)
-    
-    if cedear_closes.empty:
-        return pd.DataFrame()
-        
-    # Apply Lag
-    # if lag=1, we want corr(Bench[t], Ticker[t+1])
-    # Ticker.shift(-1) puts T[t+1] at index t.
-    if lag != 0:
-        cedear_closes = cedear_closes.shift(-lag)
-
-    # Join with lsuffix to handle collisions (e.g. GLD in tickers vs GLD benchmark)
-    combined = cedear_closes.join(benchmark_series, how='inner', lsuffix='_TICKER')
-    
-    if combined.empty or benchmark_ticker not in combined.columns:
+    lag_correlations = calculate_lag_correlations(tickers, benchmark_ticker, period, interval, lags=[lag])
+    return correlations_at_lag(lag_correlations, lag)
+
+def _on_common_rows(panel: PricePanel, benchmark: PricePanel, lag: int = 0):
+    """
+    Ticker and benchmark Close on the rows an inner join keeps, with row t of
+    the ticker matrix holding Ticker(t+lag) (shifted along the panel's own
+    axis). Returns (closes, bench, index); no copy when nothing needs moving.
+    """
+    bench, present = _benchmark_on_axis(panel, benchmark)
+    closes = panel.field("Close")
+    if lag == 0 and present.all():
+        return closes, bench, panel.index
+
+    rows = np.flatnonzero(present)
+    shifted = rows + lag
+    inside = (shifted >= 0) & (shifted < len(panel.index))
+    aligned = np.full((len(rows), closes.shape[1]), np.nan, order="F")
+    aligned[inside] = closes[shifted[inside]]
+    return aligned, bench[rows], panel.index[rows]
+
+
+# Historical windows in trading days (approx)
+CORRELATION_WINDOWS = {
+    "1M": 21,
+    "3M": 63,
+    "6M": 126,
+    "1Y": 252,
+}
+
+@tracing.traced
+def calculate_rolling_correlations(tickers: list, benchmark_ticker: str = "GLD", window: int = 63,
+                                   period: str = "1y", interval: str = "1d", lag: int = 0) -> pd.DataFrame:
+    """
+    Correlation over time: for every common timestamp, the correlation of
+    each ticker with the benchmark over the trailing `window` bars (all bars
+    so far while fewer are available), with Benchmark(t) vs Ticker(t+lag).
+    Returns a DataFrame indexed by timestamp with one column per ticker.
+    """
+    panel, benchmark = _load_correlation_panels(tickers, benchmark_ticker, period, interval)
+    return rolling_correlation_frame(panel, benchmark, window, lag)
+
+@memoize
+def rolling_correlation_frame(panel: PricePanel, benchmark: PricePanel, window: int = 63, lag: int = 0) -> pd.DataFrame:
+    """calculate_rolling_correlations over already loaded panels (memoized on their fingerprints)."""
+    if panel.empty or benchmark.empty:
         return pd.DataFrame()
-        
-    correlations = combined.corrwith(combined[benchmark_ticker])
-    
-    # Cleanup
-    corr_df = correlations.drop(benchmark_ticker, errors='ignore').reset_index()
-    corr_df.columns = ['Ticker', 'Correlation']
-    corr_df = corr_df.dropna().sort_values('Correlation', ascending=False)
-    
-    return corr_df
 
+    closes, bench, index = _on_common_rows(panel, benchmark, lag)
+    rolling = correlation.rolling_with(closes, bench, [window])[window]
+    return pd.DataFrame(rolling, index=index, columns=panel.tickers)
+
+@tracing.traced
 def calculate_multi_period_correlations(tickers: list, benchmark_ticker: str = "GLD", lag: int = 0) -> pd.DataFrame:
     """
     Fetches 1y/1d data and calculates correlations for 1M, 3M, 6M, and 1Y periods.
+    Each one is the last row of the rolling correlation for that window.
     """
-    period = "1y"
-    interval = "1d"
-    
-    # Fetch Data
-    df_cedears = market_data.fetch_batch_candles(tickers, period=period, interval=interval)
-    df_benchmark = yf.download(benchmark_ticker, period=period, interval=interval, auto_adjust=False, progress=False)
-    
-    cedear_closes = _get_close_data(df_cedears)
-    benchmark_closes = _get_close_data(df_benchmark)
-    
-    if benchmark_closes.empty or cedear_closes.empty:
+    panel, benchmark = _load_correlation_panels(tickers, benchmark_ticker, period="1y", interval="1d")
+    return multi_period_correlation_frame(panel, benchmark, lag)
+
+@memoize
+def multi_period_correlation_frame(panel: PricePanel, benchmark: PricePanel, lag: int = 0) -> pd.DataFrame:
+    """calculate_multi_period_correlations over already loaded panels (memoized on their fingerprints)."""
+    if panel.empty or benchmark.empty:
         return pd.DataFrame()
-        
-    if isinstance(benchmark_closes, pd.DataFrame):
-        benchmark_series = benchmark_closes.iloc[:, 0]
-    else:
-        benchmark_series = benchmark_closes
-    benchmark_series = benchmark_series.rename(benchmark_ticker)
-    
-    # Apply Lag
-    if lag != 0:
-        cedear_closes = cedear_closes.shift(-lag)
 
-    combined = cedear_closes.join(benchmark_series, how='inner', lsuffix='_TICKER')
-    
-    if combined.empty:
+    closes, bench, _ = _on_common_rows(panel, benchmark, lag)
+    if len(bench) == 0:
         return pd.DataFrame()
+
+    rolling = correlation.rolling_with(closes, bench, CORRELATION_WINDOWS.values())
+    results = {"Ticker": panel.tickers}
+    for label, days in CORRELATION_WINDOWS.items():
+        results[label] = rolling[days][-1]
         
-    # Periods in trading days (approx)
-    periods = {
-        "1M": 21,
-        "3M": 63,
-        "6M": 126,
-        "1Y": 252 
-    }
-    
-    results = {}
-    
-    for label, days in periods.items():
-        # Slice last N days
-        # We use tail(days) ensuring we don't exceed length
-        if len(combined) > days:
-            slice_df = combined.tail(days)
-        else:
-            slice_df = combined # Take all if not enough
-            
-        corrs = slice_df.corrwith(slice_df[benchmark_ticker])
-        results[label] = corrs.drop(benchmark_ticker, errors='ignore')
-        
-    # Combine results
-    df_results = pd.DataFrame(results)
-    df_results.index.name = "Ticker"
-    df_results = df_results.reset_index()
-    
-    return df_results
+    return pd.DataFrame(results)
+
+# Benchmarks for the multi-benchmark view. "CCL" is not a Yahoo ticker but the
+# implied CCL exchange rate, local price * shares per ADR / ADR price, from
+# CCL_PROXY = (local ticker, ADR ticker, local shares per ADR).
+DEFAULT_BENCHMARKS = ["GLD", "GC=F", "SPY", "CCL"]
+CCL_PROXY = ("GGAL.BA", "GGAL", 10)
+
+def benchmark_tickers(benchmarks: list) -> list:
+    """Tickers to fetch for `benchmarks`: derived benchmarks (CCL) are replaced by their components."""
+    tickers = []
+    for name in benchmarks:
+        tickers.extend(CCL_PROXY[:2] if name == "CCL" else [name])
+    return list(dict.fromkeys(tickers))
+
+
+@tracing.traced
+def load_benchmark_panel(benchmarks: list, period: str = "5d", interval: str = "1h") -> PricePanel:
+    """
+    Close panel of `benchmarks`, fetched as one batch; derived benchmarks
+    (CCL) are computed from their components. Benchmarks without data are
+    left out. The CCL proxy only has values where both legs have a bar at the
+    same timestamp (daily bars, in practice).
+    """
+    raw = market_data.fetch_panel(benchmark_tickers(benchmarks), period=period, interval=interval, fields=["Close"])
+
+    columns = {}
+    for name in benchmarks:
+        if name == "CCL":
+            local, adr, ratio = CCL_PROXY
+            if local in raw and adr in raw:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    columns[name] = raw.series(local) * ratio / raw.series(adr)
+        elif name in raw:
+            columns[name] = raw.series(name)
+    if not columns:
+        return PricePanel.blank(["Close"])
+    return PricePanel(raw.index, list(columns), {"Close": np.column_stack(list(columns.values()))})
+
+@tracing.traced
+def calculate_benchmark_correlations(tickers: list, benchmarks: list = DEFAULT_BENCHMARKS, period: str = "5d",
+                                     interval: str = "1h", lag: int = 0) -> pd.DataFrame:
+    """
+    Correlation of every ticker with every benchmark, Benchmark(t) vs
+    Ticker(t+lag), as one matrix product over the shared timestamp axis.
+    Returns a DataFrame indexed by Ticker with one column per benchmark.
+    """
+    panel = load_universe_panel(tickers, period=period, interval=interval)
+    benchmark = load_benchmark_panel(benchmarks, period=period, interval=interval)
+    return benchmark_correlation_frame(panel, benchmark, lag)
+
+@memoize
+def benchmark_correlation_frame(panel: PricePanel, benchmark: PricePanel, lag: int = 0) -> pd.DataFrame:
+    """calculate_benchmark_correlations over already loaded panels (memoized on their fingerprints)."""
+    if panel.empty or benchmark.empty:
+        return pd.DataFrame()
+
+    bench, _ = _benchmarks_on_axis(panel, benchmark)
+    matrix = correlation.cross(_shifted(panel.field("Close"), lag), bench)
+    return pd.DataFrame(matrix, index=pd.Index(panel.tickers, name="Ticker"), columns=benchmark.tickers)
+
+# Pairwise correlation state per (tickers, interval, period, window), updated
+# in place as new bars arrive; the lock serializes updates of shared states.
+PAIRWISE_BUDGET_BYTES = 128 * 1024 * 1024
+_pairwise_cache = ByteLRUCache(PAIRWISE_BUDGET_BYTES)
+_pairwise_lock = threading.Lock()
+
+def _bar_returns(panel: PricePanel) -> tuple[np.ndarray, pd.DatetimeIndex]:
+    """Close-to-close return of every bar (NaN unless both bars are present)."""
+    closes = panel.field("Close")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = closes[1:] / closes[:-1] - 1
+    returns[~np.isfinite(returns)] = np.nan
+    return returns, panel.index[1:]
+
+@tracing.traced
+def calculate_correlation_matrix(tickers: list, period: str = "1y", interval: str = "1d",
+                                 window: Optional[int] = None, cluster: bool = True) -> pd.DataFrame:
+    """
+    Correlation matrix of per-bar returns between all tickers, over the last
+    `window` bars (default: the whole period), each pair over the bars both
+    have. Ordered by hierarchical clustering when `cluster` is set, so
+    correlated tickers form blocks in a heatmap.
+    Repeated calls update the cached pair sums with new bars only; they are
+    rebuilt when any stored bar but the latest was revised.
+    """
+    panel = load_universe_panel(tickers, period=period, interval=interval)
+    if panel.empty or len(panel) < 2:
+        return pd.DataFrame()
+
+    returns, index = _bar_returns(panel)
+    key = (tuple(panel.tickers), interval, period, window)
+    with _pairwise_lock:
+        cached = _pairwise_cache.get(key)
+        state, order = cached if cached is not None else (None, None)
+        if state is None or not state.update(returns, index):
+            state, order = correlation.PairwiseCorrelation(returns, index, window), None
+        matrix = state.matrix()
+        if cluster and (order is None or order[0] != state.version):
+            order = (state.version, correlation.cluster_order(matrix))
+        _pairwise_cache.put(key, (state, order), state.nbytes)
+
+    tickers_out = np.array(panel.tickers, dtype=object)
+    if cluster:
+        matrix = matrix[np.ix_(order[1], order[1])]
+        tickers_out = tickers_out[order[1]]
+    return pd.DataFrame(matrix, index=pd.Index(tickers_out, name="Ticker"), columns=tickers_out)
+
+def comparison_series(panel: PricePanel, ticker: str, metric: str = "Cumulative Return (%)",
+                      open_baseline: bool = False) -> Optional[pd.Series]:
+    """
+    Series plotted for `ticker` in the performance comparison graph, over the
+    timestamps where it has bars:
+    - "Candle Return (%)": (Close - Open) / Open * 100 per bar.
+    - otherwise cumulative return from the first Close, or from the first
+      Open if `open_baseline`.
+    Returns None if the ticker has no bars.
+    """
+    if ticker not in panel:
+        return None
+    rows = panel.valid[:, panel.columns[ticker]]
+    if not rows.any():
+        return None
+    index = panel.index if rows.all() else panel.index[rows]
+
+    def values(field):
+        series = panel.series(ticker, field)
+        return series if rows.all() else series[rows]
+
+    closes = pd.Series(values("Close"), index=index, name=ticker)
+    if metric == "Candle Return (%)":
+        return calculate_candle_return(pd.Series(values("Open"), index=index), closes).rename(ticker)
+    baseline = values("Open")[0] if open_baseline else None
+    return normalize_to_pct_change(closes, baseline=baseline)
+
+@tracing.traced
+def comparison_frame(panel: PricePanel, tickers: list, metric: str = "Cumulative Return (%)",
+                     open_baseline: bool = False) -> pd.DataFrame:
+    """comparison_series of each ticker found in `panel`, as columns on the union of their timestamps."""
+    series = [comparison_series(panel, t, metric, open_baseline) for t in tickers]
+    series = [s for s in series if s is not None]
+    return pd.concat(series, axis=1) if series else pd.DataFrame()
 
 def normalize_to_pct_change(series: pd.Series, baseline: float = None) -> pd.Series:
     """
@@ -212,33 +482,3 @@ def calculate_candle_return(opens: pd.Series, closes: pd.Series) -> pd.Series:
     # Ensure alignment
     # If passed as series, pandas aligns by index automatically
     return (closes - opens) / opens * 100
-
-def _get_close_data(df):
-    """(Internal) Extracts Close prices from yfinance DataFrame."""
-    if df is None or df.empty:
-        return pd.DataFrame()
-    
-    if isinstance(df.columns, pd.MultiIndex):
-        for level in range(df.columns.nlevels):
-            if 'Close' in df.columns.get_level_values(level):
-                return df.xs('Close', axis=1, level=level)
-    else:
-        if 'Close' in df.columns:
-            return df[['Close']]
-            
-    return pd.DataFrame()
-
-def _get_open_data(df):
-    """(Internal) Extracts Open prices from yfinance DataFrame."""
-    if df is None or df.empty:
-        return pd.DataFrame()
-    
-    if isinstance(df.columns, pd.MultiIndex):
-        for level in range(df.columns.nlevels):
-            if 'Open' in df.columns.get_level_values(level):
-                return df.xs('Open', axis=1, level=level)
-    else:
-        if 'Open' in df.columns:
-            return df[['Open']]
-            
-    return pd.DataFrame()
@@ -0,0 +1,281 @@
+"""
+Benchmarks of the data and analysis hot paths on synthetic panels.
+
+Every scenario is a universe of SyntheticProvider tickers (250, 1,000 and
+5,000 by default) at one (interval, period) pair, run against a throwaway
+cache directory so the real store is never touched. Per scenario:
+
+- sync: cold download + merge + write of the whole universe into an empty store
+- store_read: decoding the universe panel from the candle store
+- panel_publish / panel_map: writing a shared panel and mapping it back
+- daily_performance: get_daily_performance from scratch
+- correlations: calculate_correlations (lag 0) without the result cache
+- lag_scan: the page's 21-lag correlation matrix without the result cache
+- multi_period: calculate_multi_period_correlations without the result cache
+- page_prep: what the page computes for a new session (daily changes and
+  movers, lag and benchmark correlations) with only the store warm
+
+Each case reports the median of `--repeats` timed runs (after one warm-up
+run; sync runs once) and the peak Python/NumPy heap of one more run traced
+with tracemalloc. Arrow buffers and memory-mapped pages are not counted.
+
+Run from the project root:
+
+    python -m src.benchmark                          # full matrix, compare with the baseline
+    python -m src.benchmark --sizes 250 --intervals 1d
+    python -m src.benchmark --save-baseline          # record this machine's baseline
+    python -m src.benchmark --threshold 0.10         # fail on >10% regressions
+
+The full matrix takes the better part of an hour, mostly in the cold syncs
+of the 5,000-ticker universes; narrow it with --sizes/--intervals/--periods.
+
+Exits with status 1 when a case is slower or uses more memory than its
+baseline by more than the threshold (and the noise floor). Baselines are
+machine-specific: record them on the machine that runs the comparison.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+import pandas as pd
+
+from src import analysis, candle_store, catalog, market_calendar, market_data, result_cache, shared_panel
+from src.providers import SyntheticProvider
+
+BASELINE_PATH = "data/benchmarks/baseline.json"
+
+SIZES = [250, 1000, 5000]
+# (interval, period) pairs within Yahoo's history limits for each interval.
+SCENARIOS = [
+    ("5m", "5d"),
+    ("5m", "1mo"),
+    ("1h", "5d"),
+    ("1h", "1mo"),
+    ("1h", "1y"),
+    ("1d", "1mo"),
+    ("1d", "1y"),
+    ("1d", "5y"),
+]
+REPEATS = 5
+# A case regresses when it exceeds its baseline by more than this fraction...
+THRESHOLD = 0.25
+# ...and by more than these absolute amounts, so timer noise on fast cases does not fail the run.
+NOISE_FLOOR_SECONDS = 0.005
+NOISE_FLOOR_BYTES = 1024 * 1024
+
+BENCHMARK = "GLD"
+
+
+def use_workdir(root: str):
+    """Points the candle store, catalog, shared panels and result cache at `root`."""
+    market_data.CACHE_DIR = root
+    candle_store.STORE_DIR = os.path.join(root, "candles")
+    candle_store.LOCK_DIR = os.path.join(root, "locks")
+    catalog.CATALOG_PATH = os.path.join(root, "catalog", "partitions.sqlite")
+    shared_panel.PANELS_DIR = os.path.join(root, "panels")
+    result_cache._results.directory = os.path.join(root, "results")
+
+
+def _drop_memory():
+    """Empties the in-process tiers, as in a new process over the same store."""
+    market_data._memory_cache.clear()
+    result_cache._results.clear()
+
+
+def measure(fn: Callable[[], object], repeats: int = REPEATS, warmup: bool = True,
+            setup: Optional[Callable[[], None]] = None) -> dict:
+    """
+    Median wall time of `repeats` calls of `fn` (each preceded by `setup`,
+    untimed) and peak traced allocation of one more call.
+    """
+    if warmup:
+        if setup:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": statistics.median(times), "peak_bytes": peak, "runs": repeats}
+
+
+def run_scenario(size: int, interval: str, period: str, repeats: int = REPEATS) -> dict[str, dict]:
+    """{case: measurement} for one universe size at one interval and period, from an empty store."""
+    tickers = SyntheticProvider.universe(size)
+    start = market_calendar.period_start(period)
+    results = {}
+
+    def sync():
+        market_data.prefetch(tickers + analysis.benchmark_tickers([BENCHMARK]), period=period, interval=interval)
+
+    # Timed once, and traced on a second cold store.
+    results["sync"] = measure(sync, repeats=1, warmup=False, setup=market_data.clear_cache)
+
+    def store_read():
+        return candle_store.read_panel(tickers, interval, columns=analysis.UNIVERSE_FIELDS, start=start,
+                                       precision=analysis.UNIVERSE_PRECISION)
+
+    results["store_read"] = measure(store_read, repeats)
+
+    panel = store_read()
+    publish_dir = os.path.join(shared_panel.PANELS_DIR, "benchmark")
+    versions = itertools.count()  # a version directory can only be published once
+    results["panel_publish"] = measure(lambda: shared_panel.publish(publish_dir, str(next(versions)), panel),
+                                       repeats)
+    published = shared_panel.publish(publish_dir, str(next(versions)), panel)  # older versions are pruned
+    results["panel_map"] = measure(lambda: shared_panel.open_version(published).field("Close").sum(), repeats)
+
+    benchmark = market_data.fetch_panel([BENCHMARK], period=period, interval=interval)
+    results["daily_performance"] = measure(lambda: analysis.get_daily_performance(panel, panel.index[-1]), repeats)
+    results["correlations"] = measure(
+        lambda: analysis.correlations_at_lag(analysis.lag_correlation_matrix.__wrapped__(panel, benchmark, [0])),
+        repeats)
+    results["lag_scan"] = measure(
+        lambda: analysis.lag_correlation_matrix.__wrapped__(panel, benchmark, list(range(-10, 11))), repeats)
+    results["multi_period"] = measure(
+        lambda: analysis.multi_period_correlation_frame.__wrapped__(panel, benchmark), repeats)
+
+    def page_prep():
+        prices = market_data.fetch_panel(tickers, period="1mo", interval="1d", fields=["Close"],
+                                         precision=analysis.UNIVERSE_PRECISION)
+        changes = analysis.compute_daily_changes(prices)
+        analysis.top_movers(changes, prices.index[-1])
+        analysis.calculate_lag_correlations(tickers, BENCHMARK, period=period, interval=interval, lags=range(-10, 11))
+        analysis.calculate_benchmark_correlations(tickers, [BENCHMARK], period=period, interval=interval)
+
+    # The warm-up run syncs the daily bars the performance tables need.
+    results["page_prep"] = measure(page_prep, repeats, setup=_drop_memory)
+    return results
+
+
+def run(sizes: list[int], scenarios: list[tuple[str, str]], repeats: int = REPEATS) -> dict[str, dict]:
+    """{"<size>/<interval>/<period>/<case>": measurement} over every size and scenario."""
+    market_data.set_provider(SyntheticProvider())
+    results = {}
+    for size in sizes:
+        for interval, period in scenarios:
+            started = time.perf_counter()
+            for case, measurement in run_scenario(size, interval, period, repeats).items():
+                results[f"{size}/{interval}/{period}/{case}"] = measurement
+            print(f"{size} tickers {interval} {period}: {time.perf_counter() - started:.1f}s", flush=True)
+    return results
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float = THRESHOLD) -> pd.DataFrame:
+    """
+    One row per case: time and peak memory against the baseline, and whether
+    either regressed past `threshold` (and the noise floors).
+    """
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        row = {"Case": name, "Seconds": current["seconds"], "Peak MB": current["peak_bytes"] / 2 ** 20,
+               "Time vs Baseline": None, "Memory vs Baseline": None, "Regressed": False}
+        if base is not None:
+            row["Time vs Baseline"] = current["seconds"] / base["seconds"] if base["seconds"] else None
+            row["Memory vs Baseline"] = current["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else None
+            slower = (current["seconds"] > base["seconds"] * (1 + threshold)
+                      and current["seconds"] - base["seconds"] > NOISE_FLOOR_SECONDS)
+            larger = (current["peak_bytes"] > base["peak_bytes"] * (1 + threshold)
+                      and current["peak_bytes"] - base["peak_bytes"] > NOISE_FLOOR_BYTES)
+            row["Regressed"] = slower or larger
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict[str, dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)["results"]
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error reading baseline {path}: {e}")
+        return {}
+
+
+def save_results(results: dict[str, dict], path: str):
+    """Writes `results` (merged into the cases already in `path`) with the time and Python version."""
+    merged = load_baseline(path)
+    merged.update(results)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"recorded_at": pd.Timestamp.now(tz="UTC").isoformat(), "python": sys.version.split()[0],
+                   "results": merged}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _parse_scenarios(intervals: Optional[str], periods: Optional[str]) -> list[tuple[str, str]]:
+    wanted_intervals = intervals.split(",") if intervals else None
+    wanted_periods = periods.split(",") if periods else None
+    return [(i, p) for i, p in SCENARIOS
+            if (wanted_intervals is None or i in wanted_intervals) and (wanted_periods is None or p in wanted_periods)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data and analysis hot paths on synthetic panels.")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="universe sizes (default: %(default)s)")
+    parser.add_argument("--intervals", help="only scenarios at these intervals (e.g. 1d,1h)")
+    parser.add_argument("--periods", help="only scenarios over these periods (e.g. 5d,1y)")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="timed runs per case (default: %(default)s)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="allowed slowdown/memory growth as a fraction of the baseline (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="record these results as the baseline")
+    parser.add_argument("--output", help="also write these results to this JSON file")
+    parser.add_argument("--workdir", help="cache directory to benchmark in (default: a temporary one, deleted)")
+    args = parser.parse_args()
+
+    scenarios = _parse_scenarios(args.intervals, args.periods)
+    if not scenarios:
+        parser.error("no scenario matches --intervals/--periods")
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="operar-benchmark-")
+    use_workdir(workdir)
+    try:
+        results = run(sizes, scenarios, args.repeats)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        save_results(results, args.output)
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+
+    report = compare(results, {} if args.save_baseline else load_baseline(args.baseline), args.threshold)
+    with pd.option_context("display.max_rows", None, "display.width", 200, "display.float_format", "{:.3f}".format):
+        print(report.to_string(index=False))
+
+    regressed = report[report["Regressed"]]
+    if len(regressed):
+        print(f"{len(regressed)} case(s) regressed by more than {args.threshold:.0%}: "
+              f"{', '.join(regressed['Case'])}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,596 @@
+"""
+Partitioned columnar store for OHLCV candles.
+
+Candles are kept as one compressed Parquet file per (interval, ticker):
+
+    data/cache/candles/interval=<interval>/ticker=<ticker>/candles.parquet
+
+so a reader only opens the partitions it needs and, inside each file, only
+decodes the requested columns before slicing out the requested date range.
+
+Partitions are written to a temporary file and renamed into place, so
+readers in any process see either the old or the new file. Writers hold
+the partition's lock (see locked()), shared by threads and processes.
+"""
+import os
+import json
+import shutil
+import threading
+import urllib.parse
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src import catalog, tracing
+from src.price_panel import PANEL_FIELDS, PricePanel, blank_field, compact_volume
+
+STORE_DIR = "data/cache/candles"
+# Disk budget for the store; least recently used partitions are evicted beyond it.
+DISK_BUDGET_BYTES = 1024 * 1024 * 1024
+FIELDS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+TIME_COLUMN = "Datetime"
+
+_FILENAME = "candles.parquet"
+_META_KEY = b"operar"
+_COMPRESSION = "zstd"
+
+# Partition locks: (interval, ticker) pairs hash onto LOCK_STRIPES lock files,
+# so a sync over thousands of tickers holds a bounded number of descriptors.
+# Lock files live outside STORE_DIR so clear_store() does not pull them away
+# from a running writer.
+LOCK_DIR = "data/cache/locks"
+LOCK_STRIPES = 64
+try:
+    import fcntl
+except ImportError:  # Windows: partitions are only locked within this process
+    fcntl = None
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def is_daily_interval(interval: str) -> bool:
+    """True for daily or coarser intervals (1d, 5d, 1wk, 1mo, 3mo)."""
+    return interval.endswith(("d", "wk", "mo"))
+
+
+def _partition_path(ticker: str, interval: str) -> str:
+    # Tickers such as "GC=F" or "^GSPC" are URI-encoded so the hive-style
+    # directory names stay unambiguous.
+    safe_ticker = urllib.parse.quote(ticker, safe="")
+    return os.path.join(STORE_DIR, f"interval={interval}", f"ticker={safe_ticker}", _FILENAME)
+
+
+def _normalize_index(index, interval: str) -> pd.DatetimeIndex:
+    """
+    Daily bars are stored as naive dates, intraday bars as UTC timestamps,
+    so every partition of an interval shares the same timestamp type.
+    """
+    index = pd.DatetimeIndex(index)
+    if is_daily_interval(interval):
+        if index.tz is not None:
+            index = index.tz_localize(None)
+    elif index.tz is None:
+        index = index.tz_localize("UTC")
+    else:
+        index = index.tz_convert("UTC")
+    return index.rename(TIME_COLUMN)
+
+
+def _normalize_bound(ts, interval: str) -> Optional[pd.Timestamp]:
+    """Coerces a start/end bound to the timestamp type stored for `interval`."""
+    if ts is None:
+        return None
+    ts = pd.Timestamp(ts)
+    if is_daily_interval(interval):
+        return ts.tz_localize(None) if ts.tz is not None else ts
+    return ts.tz_localize("UTC") if ts.tz is None else ts.tz_convert("UTC")
+
+
+def _to_frame(df: Optional[pd.DataFrame], interval: str) -> pd.DataFrame:
+    """Projects a single-ticker frame onto FIELDS with a normalized, sorted, unique index."""
+    if df is None or df.empty:
+        frame = pd.DataFrame(columns=FIELDS, dtype="float64", index=pd.DatetimeIndex([]))
+    else:
+        frame = df[[c for c in FIELDS if c in df.columns]].astype("float64")
+        frame.columns.name = None
+    frame.index = _normalize_index(frame.index, interval)
+    return frame[~frame.index.duplicated(keep="last")].sort_index()
+
+
+def _session_days(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    """Distinct (naive) calendar days that have at least one bar."""
+    days = index.tz_localize(None) if index.tz is not None else index
+    return days.normalize().unique()
+
+
+def find_gaps(index: pd.DatetimeIndex, closed_days: Optional[list[str]] = None) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Interior gaps of a stored series: runs of business days between the first
+    and last bar that have no bars and are not known to be closed.
+    Each gap is returned as [start, end) days, ready to use as a download range.
+    """
+    if len(index) < 2:
+        return []
+    days = _session_days(index).values.astype("datetime64[D]")
+    expected = np.arange(days.min(), days.max() + np.timedelta64(1, "D"))
+    missing = np.setdiff1d(expected[np.is_busday(expected)], days)
+    if closed_days:
+        missing = np.setdiff1d(missing, np.array(closed_days, dtype="datetime64[D]"))
+    if len(missing) == 0:
+        return []
+
+    # A gap continues while the next missing day is the next business day.
+    following = np.busday_offset(missing, 1, roll="forward")
+    breaks = np.flatnonzero(missing[1:] != following[:-1]) + 1
+    starts = missing[np.concatenate([[0], breaks])]
+    ends = following[np.concatenate([breaks - 1, [len(missing) - 1]])]
+    return [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in zip(starts, ends)]
+
+
+def _stripe(ticker: str, interval: str) -> int:
+    return zlib.crc32(f"{interval}/{ticker}".encode()) % LOCK_STRIPES
+
+
+@contextmanager
+def locked(tickers: list[str], interval: str):
+    """
+    Holds the write locks of the partitions of `tickers` at `interval`
+    against other threads and processes. Locks are taken in a fixed order,
+    so overlapping callers cannot deadlock. Not reentrant.
+    """
+    held = []
+    try:
+        for stripe in sorted({_stripe(t, interval) for t in tickers}):
+            _thread_locks[stripe].acquire()
+            lock_file = None
+            try:
+                if fcntl is not None:
+                    os.makedirs(LOCK_DIR, exist_ok=True)
+                    lock_file = open(os.path.join(LOCK_DIR, f"{stripe:02d}.lock"), "a")
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except BaseException:
+                if lock_file is not None:
+                    lock_file.close()
+                _thread_locks[stripe].release()
+                raise
+            held.append((stripe, lock_file))
+        yield
+    finally:
+        for stripe, lock_file in reversed(held):
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+            _thread_locks[stripe].release()
+
+
+def _write_table(table: pa.Table, path: str) -> Optional[int]:
+    """
+    Writes `table` next to `path` and renames it into place.
+    Returns the size of the file, or None if it could not be written.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, tmp, compression=_COMPRESSION)
+        nbytes = os.path.getsize(tmp)
+        os.replace(tmp, path)
+        return nbytes
+    except Exception as e:
+        print(f"Error saving candles {path}: {e}")
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return None
+
+
+def _store_table(ticker: str, interval: str, table: pa.Table, meta: dict):
+    """Writes a partition with `meta` and records it in the catalog."""
+    table = table.replace_schema_metadata({_META_KEY: json.dumps(meta).encode()})
+    nbytes = _write_table(table, _partition_path(ticker, interval))
+    if nbytes is not None:
+        catalog.record(ticker, interval, meta, nbytes)
+
+
+def _write_partition(ticker: str, interval: str, frame: pd.DataFrame, coverage_start: Optional[pd.Timestamp],
+                     closed_days: list[str], expires_at: Optional[pd.Timestamp]):
+    meta = {
+        "coverage_start": coverage_start.isoformat() if coverage_start is not None else None,
+        "fetched_at": pd.Timestamp.now(tz="UTC").isoformat(),
+        "expires_at": expires_at.isoformat() if expires_at is not None else None,
+        "rows": len(frame),
+        "first_bar": frame.index[0].isoformat() if len(frame) else None,
+        "last_bar": frame.index[-1].isoformat() if len(frame) else None,
+        "gaps": [[s.date().isoformat(), e.date().isoformat()] for s, e in find_gaps(frame.index, closed_days)],
+        "closed_days": closed_days,
+    }
+    # Built column by column (no pandas schema metadata) so reads can skip
+    # the comparatively slow pandas reconstruction step.
+    arrays = {TIME_COLUMN: pa.array(frame.index)}
+    for col in frame.columns:
+        arrays[col] = pa.array(frame[col].to_numpy())
+    _store_table(ticker, interval, pa.table(arrays), meta)
+
+
+def merge_candles(ticker: str, interval: str, df: pd.DataFrame, coverage_start: Optional[pd.Timestamp] = None,
+                  fetched_ranges: Optional[list[tuple]] = None, expires_at: Optional[pd.Timestamp] = None):
+    """
+    Merges newly downloaded bars into the stored partition. New bars replace
+    stored bars with the same timestamp (the last bar of a session may have
+    been partial when it was stored). Callers hold the partition's lock.
+
+    `coverage_start` is the start of the window that was requested from the
+    provider (None meaning "max") and extends the stored coverage if it is
+    earlier, so later requests can tell whether the partition covers their
+    window even when the ticker has no bars at its start. An empty frame is
+    stored as an empty partition, recording that the window was fetched.
+    `fetched_ranges` are the [start, end) ranges that were just downloaded;
+    business days inside them that still have no bars are remembered as
+    closed (holidays) so they are not reported as gaps again.
+    `expires_at` replaces the stored expiry.
+    """
+    meta = read_metadata(ticker, interval)
+    if meta is None:
+        stored = _to_frame(None, interval)
+        closed_days = []
+    else:
+        stored = _to_frame(read_candles(ticker, interval), interval)
+        closed_days = list(meta.get("closed_days") or [])
+        stored_start = meta.get("coverage_start")
+        if stored_start is None or (coverage_start is not None and stored_start < coverage_start):
+            coverage_start = stored_start
+
+    new = _to_frame(df, interval)
+    if stored.empty:
+        frame = new
+    elif new.empty:
+        frame = stored
+    else:
+        frame = pd.concat([stored, new])
+        frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+
+    for gap_start, gap_end in find_gaps(frame.index, closed_days):
+        for range_start, range_end in fetched_ranges or []:
+            range_start = pd.Timestamp(range_start).tz_localize(None).normalize() if range_start is not None else gap_start
+            range_end = pd.Timestamp(range_end).tz_localize(None).normalize() if range_end is not None else gap_end
+            days = pd.bdate_range(max(gap_start, range_start), min(gap_end, range_end), inclusive="left")
+            closed_days.extend(d.date().isoformat() for d in days)
+
+    _write_partition(ticker, interval, frame, coverage_start, sorted(set(closed_days)), expires_at)
+
+
+def _file_metadata(path: str) -> Optional[dict]:
+    """The JSON metadata stored in a partition's footer, or None."""
+    try:
+        schema_meta = pq.read_schema(path).metadata or {}
+        return json.loads(schema_meta.get(_META_KEY, b"{}"))
+    except Exception as e:
+        print(f"Error reading candle metadata {path}: {e}")
+        return None
+
+
+def _parse_metadata(meta: dict) -> dict:
+    meta = dict(meta)
+    for key in ("coverage_start", "fetched_at", "expires_at", "first_bar", "last_bar"):
+        if meta.get(key):
+            meta[key] = pd.Timestamp(meta[key])
+    meta["gaps"] = [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in meta.get("gaps") or []]
+    return meta
+
+
+def read_metadata_batch(tickers: list[str], interval: str) -> dict[str, Optional[dict]]:
+    """
+    read_metadata for many tickers, answered from the catalog in one query.
+    Partitions the catalog does not know yet are read from their files and
+    catalogued; rows whose file is gone are dropped.
+    """
+    catalogued = catalog.lookup(tickers, interval)
+    result = {}
+    for ticker in tickers:
+        path = _partition_path(ticker, interval)
+        meta = catalogued.get(ticker)
+        if not os.path.exists(path):
+            if meta is not None:
+                catalog.remove(ticker, interval)
+            result[ticker] = None
+            continue
+        if meta is None:
+            meta = _file_metadata(path)
+            if meta is None:
+                result[ticker] = None
+                continue
+            try:
+                catalog.record(ticker, interval, meta, os.path.getsize(path))
+            except OSError:
+                pass
+        result[ticker] = _parse_metadata(meta)
+    return result
+
+
+def read_metadata(ticker: str, interval: str) -> Optional[dict]:
+    """
+    Returns the partition metadata (coverage_start, fetched_at, expires_at,
+    rows, first_bar, last_bar, gaps, closed_days) without reading any candle
+    data, or None if the partition does not exist.
+    """
+    return read_metadata_batch([ticker], interval)[ticker]
+
+
+def _read_arrays(ticker: str, interval: str, columns: Optional[list[str]], start, end):
+    """
+    Reads the projected columns of one partition as numpy arrays.
+    Returns (index, {field: values}) or None if the partition is missing.
+    """
+    path = _partition_path(ticker, interval)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        parquet_file = pq.ParquetFile(path)
+        names = parquet_file.schema_arrow.names
+        fields = [c for c in (columns if columns is not None else FIELDS) if c in names]
+        table = parquet_file.read(columns=[TIME_COLUMN] + fields)
+    except Exception as e:
+        print(f"Error loading candles {path}: {e}")
+        return None
+    _touch(path)
+
+    index = pd.DatetimeIndex(table.column(TIME_COLUMN).to_numpy(), name=TIME_COLUMN)
+    if not is_daily_interval(interval):
+        index = index.tz_localize("UTC")
+    # Partitions are written sorted, so the date range is a positional slice.
+    lo = 0 if start is None else index.searchsorted(_normalize_bound(start, interval), side="left")
+    hi = len(index) if end is None else index.searchsorted(_normalize_bound(end, interval), side="right")
+    return index[lo:hi], {c: table.column(c).to_numpy()[lo:hi] for c in fields}
+
+
+def read_candles(ticker: str, interval: str, columns: Optional[list[str]] = None,
+                 start=None, end=None) -> pd.DataFrame:
+    """
+    Reads a single-ticker partition, decoding only `columns` (default: all
+    fields) and keeping only bars in [start, end]. The returned frame is
+    backed by a read-only array, so it can be shared by cache tiers.
+    """
+    result = _read_arrays(ticker, interval, columns, start, end)
+    if result is None:
+        return pd.DataFrame()
+    index, data = result
+    block = np.column_stack(list(data.values())) if data else np.empty((len(index), 0))
+    block.flags.writeable = False
+    return pd.DataFrame(block, index=index, columns=list(data))
+
+
+def _read_parts(tickers: list[str], interval: str, columns: Optional[list[str]], start, end):
+    """
+    Reads the partitions of `tickers` that have bars in range.
+    Returns (union index, {ticker: (index, {field: values})}), or (None, {}).
+    """
+    parts = {}
+    for ticker in tickers:
+        result = _read_arrays(ticker, interval, columns, start, end)
+        if result is not None and len(result[0]):
+            parts[ticker] = result
+    index = None
+    for part_index, _ in parts.values():
+        index = part_index if index is None or index.equals(part_index) else index.union(part_index)
+    return index, parts
+
+
+@tracing.traced
+def read_batch(tickers: list[str], interval: str, columns: Optional[list[str]] = None,
+               start=None, end=None) -> pd.DataFrame:
+    """
+    Reads several partitions into one frame with (ticker, field) MultiIndex
+    columns, the same layout as yf.download(..., group_by='ticker').
+    Tickers without stored bars are left out.
+    """
+    index, parts = _read_parts(tickers, interval, columns, start, end)
+    if not parts:
+        return pd.DataFrame()
+
+    # Assemble a single 2-D block instead of concatenating one DataFrame per
+    # ticker; per-frame construction dominated the read time.
+    keys = [(t, f) for t, (_, data) in parts.items() for f in data]
+    block = np.full((len(index), len(keys)), np.nan)
+    col = 0
+    for part_index, data in parts.values():
+        rows = slice(None) if part_index.equals(index) else index.get_indexer(part_index)
+        for values in data.values():
+            block[rows, col] = values
+            col += 1
+    block.flags.writeable = False
+
+    return pd.DataFrame(block, index=index, columns=pd.MultiIndex.from_tuples(keys))
+
+
+@tracing.traced
+def read_panel(tickers: list[str], interval: str, columns: Optional[list[str]] = None,
+               start=None, end=None, precision: str = "float64") -> PricePanel:
+    """
+    Reads several partitions into a PricePanel: one (timestamps x tickers)
+    array per field on the union timestamp axis, with the dtypes of
+    `precision` (see src/price_panel.py). Only `columns` are decoded.
+    Tickers without stored bars are left out.
+    """
+    fields = list(columns) if columns is not None else PANEL_FIELDS
+    index, parts = _read_parts(tickers, interval, fields, start, end)
+    if not parts:
+        return PricePanel.blank(fields)
+
+    arrays = {f: blank_field(f, (len(index), len(parts)), precision) for f in fields}
+    for col, (part_index, data) in enumerate(parts.values()):
+        rows = slice(None) if part_index.equals(index) else index.get_indexer(part_index)
+        for f, values in data.items():
+            if arrays[f].dtype.kind == "i":
+                values = np.nan_to_num(values, nan=0.0)
+            arrays[f][rows, col] = values
+    if precision == "compact" and "Volume" in arrays:
+        arrays["Volume"] = compact_volume(arrays["Volume"])
+    return PricePanel(index, list(parts), arrays)
+
+
+def _touch(path: str):
+    """Marks a partition as recently used; its mtime is the LRU clock."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _partition_key(path: str) -> tuple[str, str]:
+    """(ticker, interval) of a partition path."""
+    ticker_dir = os.path.dirname(path)
+    interval_dir = os.path.dirname(ticker_dir)
+    return (urllib.parse.unquote(os.path.basename(ticker_dir).split("=", 1)[1]),
+            os.path.basename(interval_dir).split("=", 1)[1])
+
+
+def _partition_files() -> list[tuple[str, int, float]]:
+    """(path, size, last used) of every stored partition."""
+    files = []
+    for root, _, names in os.walk(STORE_DIR):
+        for name in names:
+            if name == _FILENAME:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+
+def disk_usage() -> int:
+    """Total bytes used by stored partitions."""
+    return sum(size for _, size, _ in _partition_files())
+
+
+def evict_to_budget(budget_bytes: Optional[int] = None) -> int:
+    """
+    Deletes least recently used partitions until the store fits in
+    `budget_bytes` (default DISK_BUDGET_BYTES). Returns the number evicted.
+    Usage comes from the catalog; the store is only walked when it is over
+    budget. Each victim is deleted under its partition lock, and skipped if
+    it was rewritten or read since the walk. Must not be called while
+    holding partition locks.
+    """
+    budget_bytes = DISK_BUDGET_BYTES if budget_bytes is None else budget_bytes
+    catalogued = catalog.total_bytes()
+    if catalogued is not None and catalogued <= budget_bytes:
+        return 0
+
+    files = _partition_files()
+    total = sum(size for _, size, _ in files)
+    evicted = 0
+    for path, size, used in sorted(files, key=lambda f: f[2]):
+        if total <= budget_bytes:
+            break
+        ticker, interval = _partition_key(path)
+        with locked([ticker], interval):
+            try:
+                if os.stat(path).st_mtime != used:
+                    continue  # rewritten or read since the walk: no longer least recently used
+                os.unlink(path)
+            except FileNotFoundError:
+                total -= size  # deleted by someone else
+                continue
+            except OSError as e:
+                print(f"Error evicting {path}: {e}")
+                continue
+            catalog.remove(ticker, interval)
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass  # a writer's temporary file is still there
+        total -= size
+        evicted += 1
+    return evicted
+
+
+def stored_intervals() -> list[str]:
+    """Intervals with at least one stored partition directory."""
+    if not os.path.isdir(STORE_DIR):
+        return []
+    return sorted(name.split("=", 1)[1] for name in os.listdir(STORE_DIR) if name.startswith("interval="))
+
+
+def stored_tickers(interval: str) -> list[str]:
+    """Tickers with a stored partition at `interval`."""
+    directory = os.path.join(STORE_DIR, f"interval={interval}")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(urllib.parse.unquote(name.split("=", 1)[1])
+                  for name in os.listdir(directory) if name.startswith("ticker="))
+
+
+def expire_partitions(tickers: list[str], interval: str) -> int:
+    """
+    Marks the stored partitions of `tickers` at `interval` stale, keeping
+    their bars, so the next read downloads their tail again.
+    Returns the number of partitions expired.
+    """
+    now = pd.Timestamp.now(tz="UTC").isoformat()
+    expired = 0
+    with locked(tickers, interval):
+        for ticker in tickers:
+            path = _partition_path(ticker, interval)
+            if not os.path.exists(path):
+                continue
+            try:
+                table = pq.read_table(path)
+                meta = json.loads((table.schema.metadata or {}).get(_META_KEY, b"{}"))
+            except Exception as e:
+                print(f"Error reading candles {path}: {e}")
+                continue
+            meta["expires_at"] = now
+            _store_table(ticker, interval, table, meta)
+            expired += 1
+    return expired
+
+
+def delete_partitions(tickers: list[str], interval: str) -> int:
+    """Deletes the stored partitions of `tickers` at `interval`. Returns the number deleted."""
+    deleted = 0
+    with locked(tickers, interval):
+        for ticker in tickers:
+            path = _partition_path(ticker, interval)
+            if not os.path.exists(path):
+                continue
+            try:
+                os.unlink(path)
+            except OSError as e:
+                print(f"Error deleting {path}: {e}")
+                continue
+            catalog.remove(ticker, interval)
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass  # a writer's temporary file is still there
+            deleted += 1
+    return deleted
+
+
+def rebuild_catalog() -> int:
+    """Re-indexes every stored partition from its file. Returns the number catalogued."""
+    catalog.clear()
+    count = 0
+    for path, size, _ in _partition_files():
+        meta = _file_metadata(path)
+        if meta is not None:
+            catalog.record(*_partition_key(path), meta, size)
+            count += 1
+    return count
+
+
+def clear_store():
+    """Deletes every stored partition."""
+    catalog.clear()
+    if os.path.exists(STORE_DIR):
+        try:
+            shutil.rmtree(STORE_DIR)
+        except Exception as e:
+            print(f"Error deleting {STORE_DIR}: {e}")
@@ -0,0 +1,179 @@
+"""
+SQLite catalog of the candle store.
+
+One row per stored partition (interval, ticker) with its coverage, row
+count, size on disk and fetch/expiry times, kept in step by candle_store
+on every write, expiry and deletion. The fetch planner reads the metadata
+of a whole ticker list with one query instead of opening every Parquet
+footer, and coverage questions ("which tickers have 5m bars, up to when?")
+are answered without touching candle data:
+
+    python -m src.catalog              # per-interval summary
+    python -m src.catalog 5m           # per-ticker coverage at 5m
+
+The Parquet metadata stays authoritative: a partition missing from the
+catalog is read from its file and added back, a row whose file is gone is
+dropped, and candle_store.rebuild_catalog() re-indexes the whole store.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Optional
+
+import pandas as pd
+
+CATALOG_PATH = "data/cache/catalog/partitions.sqlite"
+
+_COLUMNS = ["interval", "ticker", "coverage_start", "first_bar", "last_bar", "rows", "bytes",
+            "fetched_at", "expires_at", "gaps", "closed_days"]
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS partitions (
+    interval TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    coverage_start TEXT,
+    first_bar TEXT,
+    last_bar TEXT,
+    rows INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    fetched_at TEXT,
+    expires_at TEXT,
+    gaps TEXT NOT NULL DEFAULT '[]',
+    closed_days TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (interval, ticker)
+)
+"""
+# Tickers per IN (...) query, below SQLite's host parameter limit.
+_QUERY_CHUNK = 500
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """This thread's connection, reopened if the catalog file was deleted."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and os.path.exists(CATALOG_PATH):
+        return conn
+    if conn is not None:
+        conn.close()
+    os.makedirs(os.path.dirname(CATALOG_PATH), exist_ok=True)
+    conn = sqlite3.connect(CATALOG_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(_SCHEMA)
+    _local.conn = conn
+    return conn
+
+
+def record(ticker: str, interval: str, meta: dict, nbytes: int):
+    """Adds or replaces the row of a partition from its (JSON-ready) metadata."""
+    row = (interval, ticker, meta.get("coverage_start"), meta.get("first_bar"), meta.get("last_bar"),
+           int(meta.get("rows") or 0), int(nbytes), meta.get("fetched_at"), meta.get("expires_at"),
+           json.dumps(meta.get("gaps") or []), json.dumps(meta.get("closed_days") or []))
+    try:
+        _connect().execute(f"INSERT OR REPLACE INTO partitions VALUES ({', '.join('?' * len(row))})", row)
+    except sqlite3.Error as e:
+        print(f"Error updating catalog for {ticker} {interval}: {e}")
+
+
+def remove(ticker: str, interval: str):
+    try:
+        _connect().execute("DELETE FROM partitions WHERE interval = ? AND ticker = ?", (interval, ticker))
+    except sqlite3.Error as e:
+        print(f"Error updating catalog for {ticker} {interval}: {e}")
+
+
+def clear():
+    try:
+        _connect().execute("DELETE FROM partitions")
+    except sqlite3.Error as e:
+        print(f"Error clearing catalog: {e}")
+
+
+def lookup(tickers: list[str], interval: str) -> dict[str, dict]:
+    """
+    {ticker: metadata} of the catalogued partitions among `tickers`, in the
+    JSON form stored in the Parquet files (ISO timestamps). Tickers without
+    a row are left out.
+    """
+    found = {}
+    tickers = list(dict.fromkeys(tickers))
+    try:
+        conn = _connect()
+        for i in range(0, len(tickers), _QUERY_CHUNK):
+            chunk = tickers[i:i + _QUERY_CHUNK]
+            rows = conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM partitions "
+                f"WHERE interval = ? AND ticker IN ({', '.join('?' * len(chunk))})",
+                [interval] + chunk,
+            ).fetchall()
+            for row in rows:
+                meta = dict(zip(_COLUMNS, row))
+                meta["gaps"] = json.loads(meta["gaps"])
+                meta["closed_days"] = json.loads(meta["closed_days"])
+                found[meta.pop("ticker")] = meta
+    except sqlite3.Error as e:
+        print(f"Error reading catalog: {e}")
+    return found
+
+
+def version(tickers: list[str], interval: str) -> str:
+    """
+    Digest of the catalogued state (fetch time, rows, last bar) of the
+    partitions of `tickers`: changes whenever any of them is rewritten.
+    """
+    found = lookup(tickers, interval)
+    h = hashlib.blake2b(digest_size=12)
+    for ticker in tickers:
+        meta = found.get(ticker) or {}
+        h.update(f"{ticker}|{meta.get('fetched_at')}|{meta.get('rows')}|{meta.get('last_bar')}\n".encode())
+    return h.hexdigest()
+
+
+def total_bytes() -> Optional[int]:
+    """Bytes of every catalogued partition, or None if the catalog cannot be read."""
+    try:
+        return int(_connect().execute("SELECT COALESCE(SUM(bytes), 0) FROM partitions").fetchone()[0])
+    except sqlite3.Error as e:
+        print(f"Error reading catalog: {e}")
+        return None
+
+
+def coverage(interval: Optional[str] = None) -> pd.DataFrame:
+    """One row per catalogued partition (optionally of one interval), without gaps."""
+    query = f"SELECT {', '.join(_COLUMNS[:-2])} FROM partitions"
+    params = []
+    if interval is not None:
+        query += " WHERE interval = ?"
+        params.append(interval)
+    try:
+        return pd.read_sql_query(query + " ORDER BY interval, ticker", _connect(), params=params)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error reading catalog: {e}")
+        return pd.DataFrame(columns=_COLUMNS[:-2])
+
+
+def summary() -> pd.DataFrame:
+    """Per interval: partitions, rows, bytes, earliest and latest bar, last fetch."""
+    query = """
+        SELECT interval, COUNT(*) AS partitions, SUM(rows) AS rows, SUM(bytes) AS bytes,
+               MIN(first_bar) AS first_bar, MAX(last_bar) AS last_bar, MAX(fetched_at) AS last_fetch
+        FROM partitions GROUP BY interval ORDER BY interval
+    """
+    try:
+        return pd.read_sql_query(query, _connect())
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error reading catalog: {e}")
+        return pd.DataFrame()
+
+
+def main():
+    interval = sys.argv[1] if len(sys.argv) > 1 else None
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(coverage(interval) if interval else summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Downsampling and WebGL figures for long comparison charts.
+
+Intraday series for many tickers hold far more points than a chart is wide.
+Each series is reduced to a point budget with a shape-preserving method
+(LTTB for smooth lines, min/max buckets for spiky per-bar values) and drawn
+with WebGL traces on an integer x-axis, one position per bar, so closed
+hours and weekends leave no gaps and no per-point date strings are built.
+
+The point budget is fixed per figure (DEFAULT_POINT_BUDGET, or the page's
+"Points per Series" choice), not derived from the viewport: Streamlit
+reports neither the chart's width nor its relayout (zoom) events to Python,
+so the figure is reduced once for the whole range. Zooming in shows the
+same coarse points; pick a larger budget (or "All") to inspect a short
+stretch in detail.
+
+plotly is imported when the first figure is built, not with this module.
+"""
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+# Points per series: about one per horizontal pixel of a full-width chart
+# (a fixed stand-in for the viewport width, see the module docstring).
+DEFAULT_POINT_BUDGET = 1000
+AXIS_TICKS = 20
+
+
+def _every_index(y: np.ndarray) -> np.ndarray:
+    """No reduction: every index, shaped like the result of the reducers."""
+    indices = np.arange(len(y))
+    return indices if y.ndim == 1 else np.repeat(indices[:, None], y.shape[1], axis=1)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points (first and last
+    included) that keep the visual shape of the line. `y` may be 2-D (one
+    series per column, sharing `x`): all columns are reduced in the same
+    pass and the result is (n_out, columns).
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return _every_index(y)
+
+    values = y.reshape(n, -1).astype(np.float64)
+    x = x.astype(np.float64)
+    columns = np.arange(values.shape[1])
+    # n_out - 2 buckets between the first and the last point.
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(values[:-1], edges[:-1], axis=0) / counts[:, None]
+
+    selected = np.empty((n_out, values.shape[1]), dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = selected[0].copy()
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Third corner: the next bucket's average (the last point for the last bucket).
+        next_x, next_y = (mean_x[i + 1], mean_y[i + 1]) if i + 1 < n_out - 2 else (x[-1], values[-1])
+        ax, ay = x[a], values[a, columns]
+        area = np.abs((ax - next_x) * (values[lo:hi] - ay) - (ax - x[lo:hi, None]) * (next_y - ay))
+        a = lo + np.argmax(area, axis=0)
+        selected[i + 1] = a
+    return selected.reshape((n_out,) + y.shape[1:])
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the minimum and maximum of each of n_out / 2 equal buckets,
+    plus the first and last point, so no spike is lost. `y` may be 2-D (one
+    series per column); the result is then (points, columns), sorted per
+    column. NaN is skipped, but a bucket without values still yields an index.
+    """
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return _every_index(y)
+
+    values = y.reshape(n, -1)
+    size = -(-n // buckets)
+    padded = np.full((buckets * size, values.shape[1]), np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size, -1)
+    # Empty slots compare as +/-inf so argmin/argmax skip them.
+    offsets = (np.arange(buckets) * size)[:, None]
+    low = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    high = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    ends = np.broadcast_to(np.array([[0], [n - 1]]), (2, values.shape[1]))
+    indices = np.sort(np.minimum(np.concatenate([ends, low, high]), n - 1), axis=0)
+    return indices.reshape((len(indices),) + y.shape[1:])
+
+
+def downsample(x: np.ndarray, y: np.ndarray, n_out: int, method: str = "lttb") -> np.ndarray:
+    """Indices kept by `method` ('lttb' or 'minmax') for about `n_out` points per series."""
+    if method == "minmax":
+        return minmax_indices(y, n_out)
+    return lttb_indices(x, y, n_out)
+
+
+def comparison_figure(data: pd.DataFrame, y_title: str, intraday: bool,
+                      point_budget: int = DEFAULT_POINT_BUDGET, method: str = "lttb") -> "go.Figure":
+    """
+    One downsampled Scattergl line per column of `data`, on an integer
+    x-axis (the row position) labelled with AXIS_TICKS formatted dates.
+    """
+    import plotly.graph_objects as go
+
+    date_format = "%Y-%m-%d %H:%M" if intraday else "%Y-%m-%d"
+    positions = np.arange(len(data))
+    values = data.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+
+    # All series are reduced together; gaps are bridged for point selection
+    # only, and points that were missing are dropped afterwards.
+    filled = data.ffill().bfill().to_numpy(dtype=np.float64)
+    kept = downsample(positions, filled, point_budget, method) if len(data) else np.empty((0, values.shape[1]), dtype=int)
+
+    series = []
+    for j in range(values.shape[1]):
+        x = np.unique(kept[:, j])
+        series.append(x[valid[x, j]])
+    # Format each date label once, whichever series uses it.
+    shown = np.unique(np.concatenate(series)) if series else np.empty(0, dtype=int)
+    labels = np.empty(len(data), dtype=object)
+    labels[shown] = data.index[shown].strftime(date_format)
+
+    fig = go.Figure()
+    for j, x in enumerate(series):
+        fig.add_trace(go.Scattergl(
+            x=x,
+            y=values[x, j],
+            mode='lines',
+            name=str(data.columns[j]),
+            customdata=labels[x],
+            hovertemplate="%{customdata}: %{y:.2f}",
+        ))
+
+    ticks = np.unique(np.linspace(0, max(len(data) - 1, 0), min(len(data), AXIS_TICKS)).astype(int))
+    fig.update_layout(
+        title="Performance Comparison",
+        xaxis_title="Date",
+        yaxis_title=y_title,
+        height=600,
+        hovermode="x unified",
+        xaxis=dict(
+            tickmode='array',
+            tickvals=ticks,
+            ticktext=list(data.index[ticks].strftime(date_format)),
+        ),
+    )
+    return fig
@@ -0,0 +1,290 @@
+"""
+Vectorized correlation kernels over aligned price arrays.
+
+Inputs are (timestamps, tickers) arrays from a PricePanel and a benchmark
+series on the same timestamp axis, with NaN marking missing bars. Every
+correlation is computed over the pairs where both sides are present, like
+pandas' corrwith. Compact (float32) panels are accepted; sums are always
+accumulated in float64.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def pearson_with(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Correlation of every column of `x` with `y`. NaN with fewer than two
+    pairs or no variance.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    both = ~np.isnan(x) & ~np.isnan(y)[:, None]
+    n = both.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dx = np.where(both, x, 0.0)
+        dy = np.where(both, y[:, None], 0.0)
+        dx = np.where(both, dx - dx.sum(axis=0) / n, 0.0)
+        dy = np.where(both, dy - dy.sum(axis=0) / n, 0.0)
+        corr = (dx * dy).sum(axis=0) / np.sqrt((dx * dx).sum(axis=0) * (dy * dy).sum(axis=0))
+    corr[(n < 2) | ~np.isfinite(corr)] = np.nan
+    return corr
+
+
+def _from_sums(n, sx, sy, sxx, syy, sxy) -> np.ndarray:
+    """Pearson correlation from pairwise sums (any matching shapes)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        corr = (n * sxy - sx * sy) / np.sqrt(var_x * var_y)
+        # Rounding can leave a zero variance slightly positive.
+        degenerate = (n < 2) | (var_x <= 1e-12 * n * sxx) | (var_y <= 1e-12 * n * syy)
+    corr[degenerate] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _centered(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (values minus their column means with NaN as 0, presence as 0/1).
+    Pearson is shift invariant; centering keeps the running sums small.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    mean = filled.sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+    return np.where(present, values - mean, 0.0), present.astype(np.float64)
+
+
+def cross(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Correlation of every column of `x` with every column of `y` (same rows),
+    as a (x columns, y columns) matrix, each pair over the rows where both
+    are present. Six matrix products for all pairs.
+    """
+    x0, vx = _centered(x)
+    y0, vy = _centered(y)
+    return _from_sums(vx.T @ vy, x0.T @ vy, vx.T @ y0, (x0 * x0).T @ vy, vx.T @ (y0 * y0), x0.T @ y0)
+
+
+def lag_scan(x: np.ndarray, y: np.ndarray, lags: Iterable[int]) -> np.ndarray:
+    """
+    Correlation of Benchmark(t) with Ticker(t+lag) for every ticker (column
+    of `x`) and every lag, as a (tickers, lags) matrix.
+
+    `x` is shifted along its own rows; rows where `y` is NaN do not count.
+    All lags are evaluated together: the shifted copies of `x` are strided
+    windows over one NaN-padded array, so nothing is copied per lag.
+    """
+    lags = np.asarray(list(lags), dtype=int)
+    n_rows, n_tickers = x.shape
+    if len(lags) == 0 or n_rows == 0:
+        return np.full((n_tickers, len(lags)), np.nan)
+
+    lo, hi = int(lags.min()), int(lags.max())
+    pad = max(abs(lo), abs(hi))
+    x0, vx = _centered(x)
+    y0, vy = _centered(y)
+
+    def windows(values):
+        padded = np.zeros((n_rows + 2 * pad, n_tickers))
+        padded[pad:pad + n_rows] = values
+        # windows[t, j, k] = values[t + lo + k, j]
+        return sliding_window_view(padded, hi - lo + 1, axis=0)[pad + lo:pad + lo + n_rows]
+
+    wx, wv = windows(x0), windows(vx)
+    y0_sq = y0 * y0
+    n = np.einsum("tjk,t->jk", wv, vy)
+    sx = np.einsum("tjk,t->jk", wx, vy)
+    sxx = np.einsum("tjk,t->jk", windows(x0 * x0), vy)
+    sy = np.einsum("tjk,t->jk", wv, y0)
+    syy = np.einsum("tjk,t->jk", wv, y0_sq)
+    sxy = np.einsum("tjk,t->jk", wx, y0)
+    corr = _from_sums(n, sx, sy, sxx, syy, sxy)
+    return corr[:, lags - lo]
+
+
+def rolling_with(x: np.ndarray, y: np.ndarray, windows: Iterable[int]) -> dict[int, np.ndarray]:
+    """
+    Trailing-window correlation of every column of `x` with `y`, for each
+    window length (in rows), as {window: (rows, tickers) array}. Row t covers
+    rows t-window+1..t, or all rows up to t while fewer are available.
+
+    Each pairwise sum is one cumulative sum over the rows, and a window is the
+    difference of two of them, so every window length costs O(rows x tickers).
+    """
+    x0, vx = _centered(x)
+    y0, vy = _centered(y)
+    vy, y0 = vy[:, None], y0[:, None]
+    terms = (vx * vy, x0 * vy, vx * y0, x0 * x0 * vy, vx * y0 * y0, x0 * y0)
+
+    n_rows = len(x)
+    sums = []
+    for term in terms:
+        cumulative = np.zeros((n_rows + 1, x.shape[1]))
+        np.cumsum(term, axis=0, out=cumulative[1:])
+        sums.append(cumulative)
+
+    results = {}
+    ends = np.arange(1, n_rows + 1)
+    for window in windows:
+        starts = np.maximum(ends - window, 0)
+        results[window] = _from_sums(*(s[ends] - s[starts] for s in sums))
+    return results
+
+
+def _pair_sums(x0: np.ndarray, present: np.ndarray) -> list[np.ndarray]:
+    """[n, sx, sxx, sxy] over rows for every pair (i, j); sx[i, j] sums x_i where both are present."""
+    return [present.T @ present, x0.T @ present, (x0 * x0).T @ present, x0.T @ x0]
+
+
+def pairwise(x: np.ndarray) -> np.ndarray:
+    """
+    Correlation matrix between the columns of `x`, each pair over the rows
+    where both are present (like DataFrame.corr). A handful of matrix
+    products instead of one pass per pair.
+    """
+    x0, present = _centered(x)
+    return _pair_matrix(*_pair_sums(x0, present))
+
+
+def _pair_matrix(n, sx, sxx, sxy) -> np.ndarray:
+    corr = _from_sums(n, sx, sx.T, sxx, sxx.T, sxy)
+    # Exactly 1 on the diagonal, except for series without variance.
+    np.fill_diagonal(corr, np.where(np.isnan(np.diag(corr)), np.nan, 1.0))
+    return corr
+
+
+class PairwiseCorrelation:
+    """
+    Pairwise correlation over the last `window` rows (all rows if None) of a
+    (timestamps, tickers) array, kept as running pair sums so that new bars
+    are added, and rows leaving the window removed, without recomputing.
+
+    The last stored row may be revised (a bar still forming); update()
+    compares every other stored row with the incoming ones and asks for a
+    rebuild if any of them changed.
+    """
+
+    def __init__(self, values: np.ndarray, index, window: Optional[int] = None):
+        self.window = window
+        values, index = (values[-window:], index[-window:]) if window else (values, index)
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        # Pearson is shift invariant: fixed reference means keep the sums small
+        # and stay valid as rows come and go.
+        self._mean = np.where(present, values, 0.0).sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+        self.index = index
+        self._x0, self._present = self._center(values)
+        self._sums = _pair_sums(self._x0, self._present)
+        self.version = 0
+
+    def _center(self, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        return np.where(present, values - self._mean, 0.0), present.astype(np.float64)
+
+    def _apply(self, x0: np.ndarray, present: np.ndarray, sign: float):
+        for total, delta in zip(self._sums, _pair_sums(x0, present)):
+            total += sign * delta
+
+    def update(self, values: np.ndarray, index) -> bool:
+        """
+        Brings the sums to the window ending at index[-1]. `values`/`index`
+        must contain the stored rows, unchanged except for the last one,
+        followed by any new ones. Returns False if they do not (the caller
+        should build a new instance).
+        """
+        if len(self.index) == 0:
+            return False
+        pos = index.get_indexer([self.index[-1]])[0]
+        first = pos - len(self.index) + 1
+        if pos < 0 or first < 0 or not index[first:pos + 1].equals(self.index):
+            return False
+        # Any revised row but the last invalidates the sums. O(rows x tickers),
+        # against O(rows x tickers^2) for a rebuild.
+        x0, present = self._center(values[first:pos])
+        if not (np.array_equal(present, self._present[:-1]) and np.array_equal(x0, self._x0[:-1])):
+            return False
+
+        # Revised last row: take it out and add it back with the new values.
+        start = pos + 1
+        x0, present = self._center(values[pos:pos + 1])
+        if not (np.array_equal(present, self._present[-1:]) and np.array_equal(x0, self._x0[-1:])):
+            self._apply(self._x0[-1:], self._present[-1:], -1.0)
+            self._x0, self._present, self.index = self._x0[:-1], self._present[:-1], self.index[:-1]
+            start = pos
+        if start == len(index):
+            return True
+
+        new_x0, new_present = self._center(values[start:])
+        self._apply(new_x0, new_present, 1.0)
+        self._x0 = np.concatenate([self._x0, new_x0])
+        self._present = np.concatenate([self._present, new_present])
+        self.index = self.index.append(index[start:])
+
+        excess = len(self.index) - self.window if self.window else 0
+        if excess > 0:
+            self._apply(self._x0[:excess], self._present[:excess], -1.0)
+            self._x0, self._present, self.index = self._x0[excess:], self._present[excess:], self.index[excess:]
+        self.version += 1
+        return True
+
+    def matrix(self) -> np.ndarray:
+        return _pair_matrix(*self._sums)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.nbytes for s in self._sums) + self._x0.nbytes + self._present.nbytes
+
+
+def cluster_order(corr: np.ndarray) -> np.ndarray:
+    """
+    Leaf order of an average-linkage hierarchical clustering on the distance
+    1 - corr (NaN treated as uncorrelated), for heatmaps where correlated
+    tickers sit next to each other. Uses the nearest-neighbour chain
+    algorithm, O(n^2).
+    """
+    n = len(corr)
+    if n <= 2:
+        return np.arange(n)
+    dist = 1.0 - np.nan_to_num(corr, nan=0.0)
+    np.fill_diagonal(dist, np.inf)
+    size = np.ones(n)
+    # Clusters live in the slot of one of their members; children of merged nodes.
+    node = np.arange(n)
+    children = {}
+    next_node = n
+    chain = []
+    remaining = n
+    while remaining > 1:
+        if not chain:
+            chain.append(int(np.argmax(size > 0)))
+        a = chain[-1]
+        b = int(np.argmin(dist[a]))
+        if len(chain) > 1 and dist[a, chain[-2]] <= dist[a, b]:
+            b = chain[-2]
+        if len(chain) < 2 or b != chain[-2]:
+            chain.append(b)
+            continue
+
+        chain.pop()
+        chain.pop()
+        # Lance-Williams update for average linkage; b's slot is retired.
+        merged = (size[a] * dist[a] + size[b] * dist[b]) / (size[a] + size[b])
+        dist[a], dist[:, a] = merged, merged
+        dist[a, a] = np.inf
+        dist[b], dist[:, b] = np.inf, np.inf
+        children[next_node] = (node[a], node[b])
+        node[a], size[a], size[b] = next_node, size[a] + size[b], 0
+        next_node += 1
+        remaining -= 1
+
+    order, stack = [], [next_node - 1]
+    while stack:
+        current = stack.pop()
+        if current < n:
+            order.append(current)
+        else:
+            left, right = children[current]
+            stack.extend((right, left))
+    return np.array(order)
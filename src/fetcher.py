@@ -0,0 +1,113 @@
+"""
+Bounded concurrent fetch engine.
+
+Splits a ticker universe into chunks, downloads them on a small worker pool
+behind a token-bucket rate limiter, retries failed chunks with exponential
+backoff and merges whatever succeeded, so one bad chunk does not blank the
+whole universe.
+
+The download function is pluggable: any callable taking a list of tickers
+and returning a (ticker, field) MultiIndex DataFrame, which lets the engine
+run offline against a simulated slow or flaky provider.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import pandas as pd
+
+from src import tracing
+
+
+class RateLimiter:
+    """
+    Token bucket: `rate` tokens per second, holding at most `capacity`.
+    A request larger than the bucket waits for a full bucket and leaves a
+    debt that later callers pay back, so the long-run rate is respected.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Blocks until `tokens` may be spent. Returns the time waited, in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (min(tokens, self.capacity) - self._tokens) / self.rate)
+            self._tokens -= tokens
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def chunked(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with jitter (50-100% of the nominal delay)."""
+    return min(maximum, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+def _fetch_chunk(chunk: list[str], download: Callable[[list[str]], pd.DataFrame],
+                 rate_limiter: Optional[RateLimiter], max_retries: int,
+                 backoff: float, max_backoff: float) -> Optional[pd.DataFrame]:
+    """
+    Downloads one chunk, retrying on exceptions.
+    Returns None once the retries are exhausted.
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            waited = rate_limiter.acquire(len(chunk))
+            if waited:
+                tracing.count("fetch.rate_limit_wait_seconds", waited)
+        try:
+            with tracing.span("fetch.download", tickers=len(chunk), attempt=attempt):
+                return download(chunk)
+        except Exception as e:
+            error = e
+        if attempt < max_retries:
+            tracing.count("fetch.retries")
+            time.sleep(_backoff_delay(attempt, backoff, max_backoff))
+    tracing.error(f"Error fetching chunk of {len(chunk)} tickers ({chunk[0]}...): {error}")
+    return None
+
+
+def fetch_chunked(tickers: list[str], download: Callable[[list[str]], pd.DataFrame],
+                  chunk_size: int = 50, max_workers: int = 4, rate_limiter: Optional[RateLimiter] = None,
+                  max_retries: int = 3, backoff: float = 1.0, max_backoff: float = 30.0) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Downloads `tickers` in chunks of `chunk_size` on at most `max_workers`
+    threads. Each chunk spends len(chunk) tokens of `rate_limiter`, so its
+    rate is expressed in tickers per second.
+
+    Returns (data, failed): the merged (ticker, field) frame of every chunk
+    that succeeded, and the tickers of chunks that failed after `max_retries`.
+    """
+    if not tickers:
+        return pd.DataFrame(), []
+
+    chunks = chunked(list(tickers), chunk_size)
+    workers = max(1, min(max_workers, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Each chunk runs in a copy of the caller's trace context.
+        results = list(pool.map(
+            lambda fetch: fetch(),
+            [tracing.bind(lambda chunk=chunk: _fetch_chunk(chunk, download, rate_limiter, max_retries,
+                                                           backoff, max_backoff)) for chunk in chunks],
+        ))
+
+    frames = [df for df in results if df is not None and not df.empty]
+    failed = [t for chunk, df in zip(chunks, results) if df is None for t in chunk]
+    if not frames:
+        return pd.DataFrame(), failed
+    data = frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+    return data, failed
@@ -0,0 +1,241 @@
+"""
+Trading calendars (NYSE, BYMA), yfinance period arithmetic and the
+freshness policy of stored candles.
+
+Holidays follow the regular rules of each exchange; one-off closures and
+early closes are not modelled. A day the store has learnt to be closed
+(see candle_store closed_days) is still handled by the fetch planner.
+"""
+import re
+from datetime import time
+from functools import lru_cache
+from typing import Optional
+
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar, Holiday, Easter, GoodFriday, USMartinLutherKingJr, USPresidentsDay,
+    USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday,
+)
+from pandas.tseries.offsets import Day
+
+# How long daily and coarser bars stay fresh while a session is running:
+# the current day's bar keeps changing, but not enough to justify a
+# re-download every minute.
+DAILY_OPEN_TTL = pd.Timedelta(minutes=30)
+
+INTERVAL_LENGTHS = {
+    "1m": pd.Timedelta(minutes=1),
+    "2m": pd.Timedelta(minutes=2),
+    "5m": pd.Timedelta(minutes=5),
+    "15m": pd.Timedelta(minutes=15),
+    "30m": pd.Timedelta(minutes=30),
+    "60m": pd.Timedelta(hours=1),
+    "90m": pd.Timedelta(minutes=90),
+    "1h": pd.Timedelta(hours=1),
+    "1d": pd.Timedelta(days=1),
+    "5d": pd.Timedelta(days=5),
+    "1wk": pd.Timedelta(weeks=1),
+    "1mo": pd.Timedelta(days=30),
+    "3mo": pd.Timedelta(days=90),
+}
+
+_PERIOD_RE = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+
+def _argentine_movable(dt):
+    """Law 27.399: Tuesday/Wednesday holidays move to the previous Monday, Thursday/Friday to the next."""
+    if dt.weekday() in (1, 2):
+        return dt - pd.Timedelta(days=dt.weekday())
+    if dt.weekday() in (3, 4):
+        return dt + pd.Timedelta(days=7 - dt.weekday())
+    return dt
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    rules = [
+        # Only moved forward: NYSE trades on Friday Dec 31 when Jan 1 is a Saturday.
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+class BYMAHolidayCalendar(AbstractHolidayCalendar):
+    rules = [
+        Holiday("Año Nuevo", month=1, day=1),
+        Holiday("Carnaval (lunes)", month=1, day=1, offset=[Easter(), Day(-48)]),
+        Holiday("Carnaval (martes)", month=1, day=1, offset=[Easter(), Day(-47)]),
+        Holiday("Día de la Memoria", month=3, day=24),
+        Holiday("Malvinas", month=4, day=2),
+        Holiday("Jueves Santo", month=1, day=1, offset=[Easter(), Day(-3)]),
+        GoodFriday,
+        Holiday("Día del Trabajador", month=5, day=1),
+        Holiday("Revolución de Mayo", month=5, day=25),
+        Holiday("Güemes", month=6, day=17, observance=_argentine_movable),
+        Holiday("Belgrano", month=6, day=20),
+        Holiday("Independencia", month=7, day=9),
+        Holiday("San Martín", month=8, day=17, observance=_argentine_movable),
+        Holiday("Diversidad Cultural", month=10, day=12, observance=_argentine_movable),
+        Holiday("Soberanía Nacional", month=11, day=20, observance=_argentine_movable),
+        Holiday("Inmaculada Concepción", month=12, day=8),
+        Holiday("Navidad", month=12, day=25),
+    ]
+
+
+EXCHANGES = {
+    "NYSE": {"tz": "America/New_York", "open": time(9, 30), "close": time(16, 0), "calendar": NYSEHolidayCalendar},
+    "BYMA": {"tz": "America/Argentina/Buenos_Aires", "open": time(11, 0), "close": time(17, 0), "calendar": BYMAHolidayCalendar},
+}
+
+
+def exchange_for(ticker: str) -> str:
+    """BYMA for '.BA' listings, NYSE (US hours) for everything else."""
+    return "BYMA" if ticker.upper().endswith(".BA") else "NYSE"
+
+
+@lru_cache(maxsize=None)
+def _holidays(exchange: str, year: int) -> frozenset:
+    calendar = EXCHANGES[exchange]["calendar"]()
+    days = calendar.holidays(start=f"{year}-01-01", end=f"{year}-12-31")
+    return frozenset(d.date() for d in days)
+
+
+def is_trading_day(exchange: str, day) -> bool:
+    day = pd.Timestamp(day)
+    return day.weekday() < 5 and day.date() not in _holidays(exchange, day.year)
+
+
+def trading_days(exchange: str, start, end) -> pd.DatetimeIndex:
+    """Naive dates of the sessions between `start` and `end`, inclusive."""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    start = start.tz_localize(None) if start.tz is not None else start
+    end = end.tz_localize(None) if end.tz is not None else end
+    days = pd.bdate_range(start.normalize(), end.normalize())
+    if days.empty:
+        return days
+    holidays = [d for year in range(days[0].year, days[-1].year + 1) for d in _holidays(exchange, year)]
+    return days[~days.isin(pd.DatetimeIndex(holidays))]
+
+
+def period_start(period: str, now=None) -> Optional[pd.Timestamp]:
+    """
+    Converts a yfinance period ('5d', '1mo', '1y', 'ytd', 'max') into the UTC
+    start of the requested window. Returns None for 'max'.
+    Day periods count business days, like Yahoo's trading-day periods.
+    """
+    now = _utc(now)
+    if period == "max":
+        return None
+    if period == "ytd":
+        return now.normalize().replace(month=1, day=1)
+
+    match = _PERIOD_RE.match(period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+    n, unit = int(match.group(1)), match.group(2)
+    offsets = {
+        "d": pd.offsets.BDay(n),
+        "wk": pd.DateOffset(weeks=n),
+        "mo": pd.DateOffset(months=n),
+        "y": pd.DateOffset(years=n),
+    }
+    return (now - offsets[unit]).normalize()
+
+
+def session_bounds(exchange: str, day) -> tuple[pd.Timestamp, pd.Timestamp]:
+    """(open, close) of the regular session on `day`, in UTC."""
+    spec = EXCHANGES[exchange]
+    day = pd.Timestamp(day).date()
+    open_ = pd.Timestamp.combine(day, spec["open"]).tz_localize(spec["tz"]).tz_convert("UTC")
+    close = pd.Timestamp.combine(day, spec["close"]).tz_localize(spec["tz"]).tz_convert("UTC")
+    return open_, close
+
+
+def _local_day(exchange: str, ts: pd.Timestamp) -> pd.Timestamp:
+    return ts.tz_convert(EXCHANGES[exchange]["tz"]).normalize().tz_localize(None)
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts) if ts is not None else pd.Timestamp.now(tz="UTC")
+    return ts.tz_localize("UTC") if ts.tz is None else ts.tz_convert("UTC")
+
+
+def is_open(exchange: str, ts=None) -> bool:
+    """True if `ts` (default: now) falls inside a regular session."""
+    ts = _utc(ts)
+    day = _local_day(exchange, ts)
+    if not is_trading_day(exchange, day):
+        return False
+    open_, close = session_bounds(exchange, day)
+    return open_ <= ts < close
+
+
+def next_open(exchange: str, ts=None) -> pd.Timestamp:
+    """First session open strictly after `ts`, in UTC."""
+    ts = _utc(ts)
+    day = _local_day(exchange, ts)
+    while True:
+        if is_trading_day(exchange, day):
+            open_, _ = session_bounds(exchange, day)
+            if open_ > ts:
+                return open_
+        day += pd.Timedelta(days=1)
+
+
+def session_close(exchange: str, ts=None) -> Optional[pd.Timestamp]:
+    """Close of the session running at `ts`, or None if the market is closed."""
+    ts = _utc(ts)
+    if not is_open(exchange, ts):
+        return None
+    return session_bounds(exchange, _local_day(exchange, ts))[1]
+
+
+def next_bar_close(exchange: str, interval: str, ts=None) -> pd.Timestamp:
+    """
+    When the bar running at `ts` closes, in UTC; while the market is closed,
+    when the first bar of the next session closes. Intraday bars are aligned
+    to the session open and the last one is cut at the close; daily and
+    coarser bars close with the session.
+    """
+    ts = _utc(ts)
+    if is_open(exchange, ts):
+        open_, close = session_bounds(exchange, _local_day(exchange, ts))
+    else:
+        open_ = next_open(exchange, ts)
+        close = session_bounds(exchange, _local_day(exchange, open_))[1]
+    length = INTERVAL_LENGTHS.get(interval, pd.Timedelta(days=1))
+    if length >= pd.Timedelta(days=1):
+        return close
+    bars = (ts - open_) // length + 1 if ts >= open_ else 1
+    return min(open_ + bars * length, close)
+
+
+def _open_ttl(interval: str) -> pd.Timedelta:
+    length = INTERVAL_LENGTHS.get(interval, pd.Timedelta(days=1))
+    return min(length, DAILY_OPEN_TTL) if length >= pd.Timedelta(days=1) else length
+
+
+def expires_at(ticker: str, interval: str, fetched_at=None) -> pd.Timestamp:
+    """
+    When data for `ticker`/`interval` fetched at `fetched_at` goes stale:
+
+    - fetched during a session: one bar later (DAILY_OPEN_TTL for daily and
+      coarser bars), but no later than the close, so the final bars of the
+      session are picked up once;
+    - fetched while the market is closed: one bar after the next open.
+      A closed day's bars therefore stay fresh until new bars can exist.
+    """
+    exchange = exchange_for(ticker)
+    fetched_at = _utc(fetched_at)
+    ttl = _open_ttl(interval)
+    close = session_close(exchange, fetched_at)
+    if close is not None:
+        return min(fetched_at + ttl, close)
+    return next_open(exchange, fetched_at) + ttl
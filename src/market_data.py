@@ -1,95 +1,327 @@
-import yfinance as yf
 import pandas as pd
 from typing import Optional
 
 import os
-import pickle
-import hashlib
+
+from src import candle_store, fetcher, market_calendar, providers, result_cache, shared_panel, tracing
+from src.memory_cache import ByteLRUCache, SingleFlight, frame_nbytes
+from src.price_panel import PricePanel
 
 CACHE_DIR = "data/cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
-def _get_cache_path(func_name, *args, **kwargs):
-    """Generates a cache filename based on function usage."""
-    # Create a unique key from arguments
-    # We explicitly handle list arguments (like tickers) to ensure stable hashing
-    arg_str = str(args) + str(kwargs)
-    # Use MD5 for a short, deterministic suffix
-    arg_hash = hashlib.md5(arg_str.encode()).hexdigest()
-    
-    # Try to make a readable part if possible (e.g. for single ticker)
-    readable_part = ""
-    if args and isinstance(args[0], str):
-        readable_part = f"_{args[0]}"
-    
-    filename = f"{func_name}{readable_part}_{arg_hash}.pkl"
-    return os.path.join(CACHE_DIR, filename)
-
-def _load_from_cache(path):
-    if os.path.exists(path):
-        try:
-            with open(path, "rb") as f:
-                return pickle.load(f)
-        except Exception as e:
-            print(f"Error loading cache {path}: {e}")
-    return None
-
-def _save_to_cache(path, data):
-    try:
-        with open(path, "wb") as f:
-            pickle.dump(data, f)
-    except Exception as e:
-        print(f"Error saving cache {path}: {e}")
-
-def fetch_candles(ticker: str, period: str = "7d", interval: str = "1h", suffix: str = "") -> pd.DataFrame:
+# Memory tier in front of the candle store, shared by every session of this process.
+MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+_memory_cache = ByteLRUCache(MEMORY_BUDGET_BYTES)
+# Concurrent misses on the same read wait for a single sync instead of each downloading.
+_in_flight = SingleFlight()
+
+# Where bars come from: yfinance unless OPERAR_PROVIDER selects an offline provider.
+_provider = providers.provider_from_env()
+
+# Network side: tickers per provider call, concurrent calls, and a
+# process-wide limit on tickers requested per second from rate-limited
+# (network) providers.
+FETCH_CHUNK_SIZE = 50
+FETCH_WORKERS = 4
+FETCH_RETRIES = 3
+_rate_limiter = fetcher.RateLimiter(rate=20.0, capacity=FETCH_CHUNK_SIZE)
+
+def _is_stale(meta: dict) -> bool:
+    """Stale once the expiry computed by the market calendar at fetch time has passed."""
+    expires_at = meta.get("expires_at")
+    return expires_at is None or pd.Timestamp.now(tz="UTC") >= expires_at
+
+def _plan_ranges(meta: Optional[dict], start: Optional[pd.Timestamp], interval: str,
+                 refresh_before: Optional[pd.Timestamp]) -> list[tuple]:
     """
-    Fetches historical candle data for a given ticker with caching.
+    Works out which [start, end) ranges are missing from a stored partition
+    for a window beginning at `start`. `(None, None)` means "download the full
+    period". An empty list means the partition already answers the request.
+    The tail is also refreshed if it was fetched before `refresh_before`.
     """
-    cache_path = _get_cache_path("fetch_candles", ticker=ticker, period=period, interval=interval, suffix=suffix)
-    cached_data = _load_from_cache(cache_path)
-    if cached_data is not None:
-        return cached_data
+    if meta is None:
+        return [(None, None)]
 
-    full_ticker = f"{ticker}{suffix}"
-    try:
-        df = yf.download(full_ticker, period=period, interval=interval, progress=False, auto_adjust=False)
-        
-        if df.empty:
-            print(f"Warning: No data found for {full_ticker}")
-            return pd.DataFrame()
-            
-        _save_to_cache(cache_path, df)
+    stored_start = meta.get("coverage_start")
+    if stored_start is not None and (start is None or start < stored_start):
+        if start is None:
+            return [(None, None)]
+        ranges = [(start, stored_start)]
+    else:
+        ranges = []
+
+    ranges.extend(meta.get("gaps", []))
+
+    fetched_at = meta.get("fetched_at")
+    refresh = refresh_before is not None and (fetched_at is None or fetched_at < refresh_before)
+    if refresh or _is_stale(meta):
+        # Re-download from the start of the last stored session: its last bar
+        # may have been partial. Flooring to the day lets tickers whose last
+        # bars differ by a few minutes share one download.
+        tail_start = meta.get("last_bar") or stored_start
+        ranges.append((tail_start.normalize() if tail_start is not None else start, None))
+    return ranges
+
+def _plan(tickers: list[str], start: Optional[pd.Timestamp], interval: str,
+          refresh_before: Optional[pd.Timestamp]) -> tuple[dict, dict]:
+    """
+    Groups tickers by the range they are missing: {(start, end): [tickers]}.
+    A batch over a subset of an already stored universe plans nothing, and a
+    batch with a few new tickers plans one full-period download for just those.
+    Also returns the stored expiry of each ticker.
+    """
+    plans = {}
+    expiries = {}
+    for t, meta in candle_store.read_metadata_batch(tickers, interval).items():
+        expiries[t] = meta.get("expires_at") if meta else None
+        for rng in _plan_ranges(meta, start, interval, refresh_before):
+            plans.setdefault(rng, []).append(t)
+    return plans, expiries
+
+def _ticker_frame(df: pd.DataFrame, ticker: str) -> pd.DataFrame:
+    """Extracts the flat OHLCV columns of `ticker` from any yf.download layout."""
+    if not isinstance(df.columns, pd.MultiIndex):
         return df
-    except Exception as e:
-        print(f"Error fetching data for {full_ticker}: {e}")
-        return pd.DataFrame()
+    for level in range(df.columns.nlevels):
+        if ticker in df.columns.get_level_values(level):
+            return df.xs(ticker, axis=1, level=level)
+    return pd.DataFrame()
+
+def _download(tickers: list[str], interval: str, period: Optional[str] = None, start=None, end=None) -> pd.DataFrame:
+    """Single provider call, either for a `period` or for a [start, end) range."""
+    return _provider.download(tickers, interval, period=period, start=start, end=end)
+
+def _sync(tickers: list[str], start: Optional[pd.Timestamp], period: str, interval: str,
+          refresh: bool = False, fresh_until: Optional[pd.Timestamp] = None) -> pd.Timestamp:
+    """
+    Brings the stored partitions of `tickers` up to date for the window
+    starting at `start`, downloading only the missing head, interior gaps and
+    (when stale per the market calendar) the tail.
+    Tickers that need the same range are downloaded together, in chunks on
+    a bounded worker pool (see src/fetcher.py).
+    Downloaded partitions expire per the market calendar, or at `fresh_until`
+    when given.
+    The partitions to download are locked and planned again once the locks
+    are held, so when several sessions or processes miss at once only the
+    first downloads and the others find its result.
+    Returns the earliest expiry among the tickers, i.e. until when a read of
+    them may be served from memory.
+    """
+    refresh_before = pd.Timestamp.now(tz="UTC") if refresh else None
+    with tracing.span("market_data.plan", tickers=len(tickers), interval=interval):
+        plans, expiries = _plan(tickers, start, interval, refresh_before)
+    if plans:
+        pending = list(dict.fromkeys(t for group in plans.values() for t in group))
+        with candle_store.locked(pending, interval):
+            plans, pending_expiries = _plan(pending, start, interval, refresh_before)
+            expiries.update(pending_expiries)
+            merged = _download_plans(plans, start, period, interval, expiries, fresh_until)
+        candle_store.evict_to_budget()
+        if merged:
+            _memory_cache.invalidate(lambda key: key[1] == interval and not merged.isdisjoint(key[0]))
+
+    now = pd.Timestamp.now(tz="UTC")
+    return min((e if e is not None else now) for e in expiries.values())
+
+def _download_plans(plans: dict, start: Optional[pd.Timestamp], period: str, interval: str,
+                    expiries: dict, fresh_until: Optional[pd.Timestamp]) -> set:
+    """
+    Downloads and merges every planned range, recording the new expiry of
+    each merged ticker in `expiries`. Returns the merged tickers.
+    """
+    merged = set()
+    for (range_start, range_end), group in plans.items():
+        def download(chunk, range_start=range_start, range_end=range_end):
+            return _download(chunk, interval, period=period, start=range_start, end=range_end)
+
+        with tracing.span("market_data.download", tickers=len(group), interval=interval, provider=_provider.name):
+            df, failed = fetcher.fetch_chunked(group, download, chunk_size=FETCH_CHUNK_SIZE,
+                                               max_workers=FETCH_WORKERS,
+                                               rate_limiter=_rate_limiter if _provider.rate_limited else None,
+                                               max_retries=FETCH_RETRIES)
+        # Failed chunks are not merged, so their tickers stay stale and are retried next time.
+        failed = set(failed)
+        tracing.count("market_data.tickers_downloaded", len(group) - len(failed))
+        tracing.count("market_data.tickers_failed", len(failed))
+        with tracing.span("market_data.merge", tickers=len(group), interval=interval):
+            for t in group:
+                if t in failed:
+                    continue
+                frame = _ticker_frame(df, t).dropna(how="all") if not df.empty else pd.DataFrame()
+                tracing.count("market_data.rows_fetched", len(frame))
+                # Tickers with no data still get a partition so they are not re-downloaded.
+                expiries[t] = fresh_until if fresh_until is not None else market_calendar.expires_at(t, interval)
+                candle_store.merge_candles(t, interval, frame, coverage_start=start,
+                                           fetched_ranges=[(range_start, range_end)],
+                                           expires_at=expiries[t])
+                merged.add(t)
+    return merged
+
+def _read_through(tickers: list[str], period: str, interval: str, columns: Optional[list[str]],
+                  refresh: bool, read, variant=None) -> pd.DataFrame:
+    """
+    Serves a read from the memory tier, or syncs the store and caches the
+    result of `read(start)` until the earliest expiry of its tickers.
+    `variant` tells apart reads of the same data in different forms.
+    Identical misses arriving while a sync is running share its result.
+    """
+    start = market_calendar.period_start(period)
+    key = (tuple(tickers), interval, tuple(columns) if columns is not None else None, start, read.__name__, variant)
+    if not refresh:
+        cached = _memory_cache.get(key)
+        if cached is not None:
+            tracing.count("memory_cache.hits")
+            return cached
+    tracing.count("memory_cache.misses")
+
+    def load():
+        with tracing.span("market_data.sync", tickers=len(tickers), interval=interval, period=period):
+            expires_at = _sync(tickers, start, period, interval, refresh)
+        with tracing.span("market_data.read", tickers=len(tickers), interval=interval, read=read.__name__):
+            df = read(start)
+        nbytes = df.nbytes if isinstance(df, PricePanel) else frame_nbytes(df)
+        tracing.count("market_data.bytes_read", nbytes)
+        _memory_cache.put(key, df, nbytes, expires_at=expires_at)
+        return df
+
+    return _in_flight.do(key + (refresh,), load)
+
+def prefetch(tickers: list[str], period: str = "7d", interval: str = "1h", suffix: str = "",
+             fresh_until: Optional[pd.Timestamp] = None) -> pd.Timestamp:
+    """
+    Brings the stored partitions of `tickers` up to date for `period` at
+    `interval` (tail included) without reading them back.
+    `fresh_until` replaces the calendar expiry of what gets downloaded: a
+    process that will refresh these partitions again at a known time (see
+    src/prefetch.py) passes it so readers do not download in between.
+    Returns the earliest expiry among the tickers.
+    """
+    full_tickers = list(dict.fromkeys(f"{t}{suffix}" for t in tickers))
+    if not full_tickers:
+        return pd.Timestamp.now(tz="UTC")
+    start = market_calendar.period_start(period)
+    return _sync(full_tickers, start, period, interval, refresh=True, fresh_until=fresh_until)
 
-def fetch_batch_candles(tickers: list[str], period: str = "7d", interval: str = "1h", suffix: str = "") -> pd.DataFrame:
+def invalidate(tickers: Optional[list[str]] = None, intervals: Optional[list[str]] = None, suffix: str = "",
+               drop: bool = False) -> int:
+    """
+    Invalidates the data of `tickers` at `intervals` only (None: every stored
+    ticker / interval): their memory-tier reads are dropped and their stored
+    partitions marked stale, so the next read downloads their tail again, or
+    deleted with `drop`. Other tickers, intervals and sessions are untouched.
+    Returns the number of partitions invalidated.
+    """
+    full_tickers = None if tickers is None else set(f"{t}{suffix}" for t in tickers)
+    intervals = candle_store.stored_intervals() if intervals is None else list(dict.fromkeys(intervals))
+    _memory_cache.invalidate(lambda key: key[1] in intervals
+                             and (full_tickers is None or not full_tickers.isdisjoint(key[0])))
+    count = 0
+    for interval in intervals:
+        stored = candle_store.stored_tickers(interval)
+        targets = stored if full_tickers is None else [t for t in stored if t in full_tickers]
+        if drop:
+            count += candle_store.delete_partitions(targets, interval)
+        else:
+            count += candle_store.expire_partitions(targets, interval)
+    return count
+
+def get_provider() -> providers.MarketDataProvider:
+    return _provider
+
+def set_provider(provider: providers.MarketDataProvider):
+    """
+    Switches the provider for this process. The store and memory tier are
+    keyed by ticker only, so callers switching between real and simulated
+    data should also call clear_cache().
+    """
+    global _provider
+    _provider = provider
+
+def cache_stats() -> dict:
+    """
+    Hit/miss/eviction counters and occupancy of the in-process memory tier,
+    plus the number of reads coalesced onto an in-flight sync.
+    """
+    stats = _memory_cache.stats()
+    stats["coalesced"] = _in_flight.coalesced
+    return stats
+
+def fetch_candles(ticker: str, period: str = "7d", interval: str = "1h", suffix: str = "",
+                  columns: Optional[list[str]] = None, refresh: bool = False) -> pd.DataFrame:
+    """
+    Fetches historical candle data for a given ticker with caching.
+    Only bars missing from the store are downloaded; `refresh` forces a tail update.
+    Only the requested `columns` (default: all OHLCV fields) are read back from the store.
+    Repeated reads are served from the in-process memory tier; the returned
+    frame is shared and read-only.
+    """
+    full_ticker = f"{ticker}{suffix}"
+
+    def read_candles(start):
+        return candle_store.read_candles(full_ticker, interval, columns=columns, start=start)
+
+    df = _read_through([full_ticker], period, interval, columns, refresh, read_candles)
+    if df.empty:
+        tracing.error(f"Warning: No data found for {full_ticker}")
+    return df
+
+def fetch_batch_candles(tickers: list[str], period: str = "7d", interval: str = "1h", suffix: str = "",
+                        columns: Optional[list[str]] = None, refresh: bool = False) -> pd.DataFrame:
     """
     Fetches historical candle data for a list of tickers in batch with caching.
+    Returns (ticker, field) MultiIndex columns. Each ticker is stored in its own
+    partition, shared with fetch_candles and with batches over other ticker
+    lists, so only tickers (and bars) missing from the store are downloaded;
+    `refresh` forces a tail update.
+    Values are always float64; use fetch_panel for float32 ("compact") reads.
+    Repeated reads are served from the in-process memory tier; the returned
+    frame is shared and read-only.
     """
     if not tickers:
         return pd.DataFrame()
-        
-    cache_path = _get_cache_path("fetch_batch_candles", tickers=tuple(sorted(tickers)), period=period, interval=interval, suffix=suffix)
-    cached_data = _load_from_cache(cache_path)
-    if cached_data is not None:
-        return cached_data
-
-    full_tickers = [f"{t}{suffix}" for t in tickers] if suffix else tickers
-    
-    try:
-        tickers_str = " ".join(full_tickers)
-        df = yf.download(tickers_str, period=period, interval=interval, group_by='ticker', auto_adjust=False, progress=True)
-        
-        _save_to_cache(cache_path, df)
-        return df
-    except Exception as e:
-        print(f"Error fetching batch data: {e}")
-        return pd.DataFrame()
+
+    full_tickers = list(dict.fromkeys(f"{t}{suffix}" for t in tickers))
+
+    def read_batch(start):
+        return candle_store.read_batch(full_tickers, interval, columns=columns, start=start)
+
+    return _read_through(full_tickers, period, interval, columns, refresh, read_batch)
+
+def fetch_panel(tickers: list[str], period: str = "7d", interval: str = "1h", suffix: str = "",
+                fields: Optional[list[str]] = None, refresh: bool = False,
+                precision: str = "float64") -> PricePanel:
+    """
+    Same data as fetch_batch_candles, as a PricePanel: one (timestamps x
+    tickers) array per field on a shared timestamp axis (default fields:
+    Open, High, Low, Close, Volume). Built once per (tickers, interval,
+    period, fields) and version of the stored bars, published as memory-mapped
+    files (src/shared_panel.py) so every process maps the same copy, and
+    shared through the memory tier; read-only.
+    Only `fields` are decoded from the store; `precision` "compact" stores
+    prices as float32 and Volume as integers (see src/price_panel.py).
+    """
+    if not tickers:
+        return PricePanel.blank(fields)
+
+    full_tickers = list(dict.fromkeys(f"{t}{suffix}" for t in tickers))
+
+    def read_panel(start):
+        def build():
+            return candle_store.read_panel(full_tickers, interval, columns=fields, start=start, precision=precision)
+        return shared_panel.load(full_tickers, interval, fields, start, build, precision)
+
+    return _read_through(full_tickers, period, interval, fields, refresh, read_panel, variant=precision)
 
 def clear_cache():
-    """Deletes all files in the cache directory."""
+    """
+    Deletes all files in the cache directory, including the candle store,
+    shared panels and memoized analysis results, and empties the memory tier.
+    """
+    _memory_cache.clear()
+    candle_store.clear_store()
+    shared_panel.clear_panels()
+    result_cache.clear_results()
     if os.path.exists(CACHE_DIR):
         for filename in os.listdir(CACHE_DIR):
             file_path = os.path.join(CACHE_DIR, filename)
@@ -0,0 +1,143 @@
+"""
+In-process LRU cache bounded by bytes.
+
+Used as the memory tier in front of the on-disk candle store. It lives at
+module level, so every Streamlit session served by the same process shares
+it. Values are returned as stored (no copy); callers must treat them as
+read-only.
+
+SingleFlight sits next to it so that concurrent misses on the same key
+(several sessions, or reruns) run one load and share its result.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import pandas as pd
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Shallow size of a DataFrame (values and index), used as its cache cost."""
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+class ByteLRUCache:
+    """Thread-safe LRU cache whose capacity is the total size of its values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, nbytes, expires_at = entry
+            if expires_at is not None and pd.Timestamp.now(tz="UTC") >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, nbytes: int, expires_at: Optional[pd.Timestamp] = None):
+        """
+        Stores `value`, evicting least recently used entries to stay within
+        max_bytes. Values larger than the whole budget are not cached.
+        """
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes, expires_at)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drops every entry whose key matches `predicate`. Returns the number dropped."""
+        with self._lock:
+            keys = [k for k in self._entries if predicate(k)]
+            for k in keys:
+                self._remove(k)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and current occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key: Hashable):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, the others wait for it and receive the same result (or the
+    same exception).
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> (done event, [result, error])
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = (threading.Event(), [None, None])
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+        done, outcome = call
+
+        if not leader:
+            done.wait()
+        else:
+            try:
+                outcome[0] = fn()
+            except BaseException as e:
+                outcome[1] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                done.set()
+
+        if outcome[1] is not None:
+            raise outcome[1]
+        return outcome[0]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
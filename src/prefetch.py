@@ -0,0 +1,152 @@
+"""
+Prefetch daemon: keeps the candle store warm for every interval the
+CEDEARs page offers, so Streamlit sessions read local data instead of
+downloading under a spinner.
+
+Each (interval, exchange) pair is refreshed just after its bars close
+during market hours (every DAILY_OPEN_TTL for daily bars) and once more
+after the close. The partitions it writes stay fresh until its next
+refresh, so sessions never download them in between; if the daemon stops,
+they go stale and sessions fall back to fetching on their own.
+
+Run from the project root:
+
+    python -m src.prefetch                 # run until interrupted
+    python -m src.prefetch --once          # warm everything once and exit
+    python -m src.prefetch --intervals 1d,1h
+"""
+import argparse
+import heapq
+import time
+from typing import Optional
+
+import pandas as pd
+
+from src import analysis, market_calendar, market_data
+
+CEDEARS_CSV = "data/cedears.csv"
+
+# Period the page loads for each interval it offers; "1d" covers both the
+# 1mo daily performance view and the 1y history.
+WARM_PERIODS = {
+    "1d": "1y",
+    "1h": "5d",
+    "30m": "5d",
+    "15m": "5d",
+    "5m": "5d",
+}
+
+# Wait after a bar closes before fetching it, so the provider has published it.
+SETTLE_DELAY = pd.Timedelta(seconds=20)
+# Partitions stay fresh this long past the next scheduled refresh, which
+# covers the refresh itself; sessions see a new bar at most this late.
+REFRESH_MARGIN = pd.Timedelta(seconds=90)
+# Delay before retrying a refresh that raised.
+RETRY_DELAY = pd.Timedelta(minutes=2)
+
+
+def warm_tickers(csv_path: str = CEDEARS_CSV) -> list[str]:
+    """The CEDEAR universe of the page plus GLD and the default benchmarks."""
+    tickers = pd.read_csv(csv_path)["byma_code"].dropna().unique().tolist()
+    return list(dict.fromkeys(tickers + analysis.benchmark_tickers(["GLD"] + analysis.DEFAULT_BENCHMARKS)))
+
+
+def next_refresh(exchange: str, interval: str, now=None) -> pd.Timestamp:
+    """
+    When `interval` bars on `exchange` should next be fetched: just after the
+    running bar closes (daily bars: every DAILY_OPEN_TTL while the session
+    runs and at the close), or after the first bar of the next session.
+    """
+    now = pd.Timestamp.now(tz="UTC") if now is None else now
+    if market_calendar.INTERVAL_LENGTHS[interval] >= pd.Timedelta(days=1):
+        close = market_calendar.session_close(exchange, now)
+        if close is not None:
+            due = min(now + market_calendar.DAILY_OPEN_TTL, close)
+        else:
+            due = market_calendar.next_open(exchange, now) + market_calendar.DAILY_OPEN_TTL
+    else:
+        due = market_calendar.next_bar_close(exchange, interval, now)
+    return due + SETTLE_DELAY
+
+
+def plan_jobs(tickers: list[str], intervals: list[str]) -> dict[tuple, list[str]]:
+    """{(interval, exchange): tickers}: one refresh schedule per calendar."""
+    jobs = {}
+    for interval in intervals:
+        for t in tickers:
+            jobs.setdefault((interval, market_calendar.exchange_for(t)), []).append(t)
+    return jobs
+
+
+def refresh(interval: str, exchange: str, tickers: list[str]) -> pd.Timestamp:
+    """
+    Downloads the new bars of `tickers` and returns when to refresh them
+    next. The partitions are marked fresh until just after that.
+    """
+    due = next_refresh(exchange, interval)
+    market_data.prefetch(tickers, period=WARM_PERIODS[interval], interval=interval,
+                         fresh_until=due + REFRESH_MARGIN)
+    return due
+
+
+def _log(message: str):
+    print(f"[{pd.Timestamp.now(tz='UTC'):%Y-%m-%d %H:%M:%S}] {message}", flush=True)
+
+
+def run(tickers: list[str], intervals: Optional[list[str]] = None, once: bool = False):
+    """
+    Warms every (interval, exchange) job, then keeps refreshing each one at
+    its next_refresh time until interrupted (or returns after the first pass
+    when `once`).
+    """
+    jobs = plan_jobs(tickers, intervals or list(WARM_PERIODS))
+    queue = [(pd.Timestamp.now(tz="UTC"), key) for key in jobs]
+    heapq.heapify(queue)
+    while queue:
+        due, key = heapq.heappop(queue)
+        wait = (due - pd.Timestamp.now(tz="UTC")).total_seconds()
+        if wait > 0:
+            time.sleep(wait)
+
+        interval, exchange = key
+        started = time.perf_counter()
+        try:
+            due = refresh(interval, exchange, jobs[key])
+            _log(f"{interval} {exchange}: {len(jobs[key])} tickers in {time.perf_counter() - started:.1f}s, "
+                 f"next at {due:%Y-%m-%d %H:%M:%S} UTC")
+        except Exception as e:
+            due = pd.Timestamp.now(tz="UTC") + RETRY_DELAY
+            _log(f"Error refreshing {interval} {exchange}: {e}; retrying at {due:%H:%M:%S} UTC")
+
+        if not once:
+            heapq.heappush(queue, (due, key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the candle store warm for the CEDEARs dashboard.")
+    parser.add_argument("--once", action="store_true", help="warm every interval once and exit")
+    parser.add_argument("--intervals", default=",".join(WARM_PERIODS),
+                        help=f"comma-separated intervals to keep warm (default: {','.join(WARM_PERIODS)})")
+    parser.add_argument("--csv", default=CEDEARS_CSV, help="CEDEAR list (default: %(default)s)")
+    args = parser.parse_args()
+
+    intervals = [i.strip() for i in args.intervals.split(",") if i.strip()]
+    unknown = [i for i in intervals if i not in WARM_PERIODS]
+    if unknown:
+        parser.error(f"unsupported intervals: {', '.join(unknown)}")
+
+    try:
+        tickers = warm_tickers(args.csv)
+    except FileNotFoundError:
+        print(f"{args.csv} not found. Please run extract_cedears.py first.")
+        return
+
+    _log(f"Keeping {len(tickers)} tickers warm at {', '.join(intervals)}")
+    try:
+        run(tickers, intervals, once=args.once)
+    except KeyboardInterrupt:
+        _log("Stopped")
+
+
+if __name__ == "__main__":
+    main()
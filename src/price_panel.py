@@ -0,0 +1,166 @@
+"""
+Aligned price panel shared by the analysis functions.
+
+A PricePanel holds one array per field (Open, High, Low, Close, Volume),
+all shaped (timestamps, tickers) on a single shared timestamp axis.
+Arrays are column-major, so each ticker's series is contiguous, and
+read-only, so one panel can be cached and handed to every session and
+analysis function without copies.
+
+Precision policies:
+- "float64": every field as float64, missing bars as NaN.
+- "compact": prices as float32 (NaN when missing) and Volume as int32, or
+  int64 if a volume does not fit, with 0 when missing; half the memory of
+  float64 for prices. The valid mask still tells which bars exist.
+Tickers are dictionary-encoded: the column axis holds each name once and
+`columns` maps names to positions.
+"""
+import hashlib
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+PANEL_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+
+PRECISIONS = ("float64", "compact")
+_PANEL_DTYPES = (np.float64, np.float32, np.int32, np.int64)
+
+
+def blank_field(field: str, shape: tuple, precision: str = "float64") -> np.ndarray:
+    """Column-major array for `field` under `precision`, every bar missing."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    if precision == "compact" and field == "Volume":
+        return np.zeros(shape, dtype=np.int64, order="F")
+    return np.full(shape, np.nan, dtype=np.float32 if precision == "compact" else np.float64, order="F")
+
+
+def compact_volume(values: np.ndarray) -> np.ndarray:
+    """int64 volumes as int32 when they all fit."""
+    if values.size and np.abs(values).max() > np.iinfo(np.int32).max:
+        return values
+    return values.astype(np.int32, order="F")
+
+
+class PricePanel:
+    """
+    - index: shared DatetimeIndex (naive for daily bars, UTC for intraday).
+    - tickers / columns: column order and the ticker -> column lookup.
+    - fields: {field: (len(index), len(tickers)) array}.
+    - valid: True where the ticker has a Close on that timestamp.
+    """
+
+    def __init__(self, index: pd.DatetimeIndex, tickers: list[str], fields: dict[str, np.ndarray],
+                 valid: Optional[np.ndarray] = None):
+        self.index = index
+        self.tickers = list(tickers)
+        self.columns = {t: i for i, t in enumerate(self.tickers)}
+        self.fields = {}
+        for name, values in fields.items():
+            values = np.asarray(values)
+            if values.dtype not in _PANEL_DTYPES:
+                values = values.astype(np.float64)
+            values = np.asfortranarray(values)
+            values.flags.writeable = False
+            self.fields[name] = values
+        if valid is not None:
+            self.valid = np.asarray(valid, dtype=bool)
+        elif "Close" in self.fields:
+            self.valid = ~np.isnan(self.fields["Close"])
+        else:
+            self.valid = np.ones((len(index), len(self.tickers)), dtype=bool)
+        self.valid.flags.writeable = False
+        self._fingerprint = None
+
+    @classmethod
+    def blank(cls, fields: Optional[list[str]] = None) -> "PricePanel":
+        fields = PANEL_FIELDS if fields is None else fields
+        return cls(pd.DatetimeIndex([]), [], {f: np.empty((0, 0)) for f in fields})
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, ticker: Optional[str] = None) -> "PricePanel":
+        """
+        Builds a panel from a (ticker, field) or (field, ticker) MultiIndex
+        frame, or from a flat single-ticker OHLCV frame named `ticker`.
+        Copies the data.
+        """
+        if df is None or df.empty:
+            return cls.blank()
+        if not isinstance(df.columns, pd.MultiIndex):
+            df = pd.concat({ticker or "": df}, axis=1)
+        elif "Close" in df.columns.get_level_values(0):
+            df = df.swaplevel(axis=1)  # yf.download's default (field, ticker) layout
+        tickers = list(dict.fromkeys(df.columns.get_level_values(0)))
+        names = [f for f in PANEL_FIELDS if f in df.columns.get_level_values(1)]
+        fields = {}
+        for f in names:
+            block = df.xs(f, axis=1, level=1).reindex(columns=tickers)
+            fields[f] = block.to_numpy(dtype=np.float64)
+        return cls(pd.DatetimeIndex(df.index), tickers, fields)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.index) == 0 or not self.tickers
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.nbytes for v in self.fields.values()) + self.valid.nbytes + self.index.nbytes
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Content hash, computed once per panel: the tickers, the timestamp
+        axis, and every value of every field and of the valid mask, so any
+        new or revised bar changes it. Arrays are hashed in place (their
+        column-major buffers), without copies.
+        """
+        if self._fingerprint is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update("\x1f".join(self.tickers).encode())
+            h.update(str(self.index.tz).encode())
+            h.update(self.index.asi8.tobytes())
+            for name, values in list(self.fields.items()) + [("valid", self.valid)]:
+                h.update(f"\x1f{name}:{values.dtype.str}:{values.shape}".encode())
+                h.update(np.asfortranarray(values).T.data)
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def memory_report(self) -> pd.DataFrame:
+        """
+        Bytes per component (each field, the valid mask, the index), with its
+        dtype and whether it is memory-mapped (shared between processes, see
+        src/shared_panel.py), plus a total row.
+        """
+        rows = []
+        parts = [(f, v) for f, v in self.fields.items()] + [("valid", self.valid)]
+        for name, values in parts:
+            base = values
+            while getattr(base, "base", None) is not None and not isinstance(base, np.memmap):
+                base = base.base
+            rows.append({"Component": name, "dtype": str(values.dtype), "Shape": values.shape,
+                         "Bytes": values.nbytes, "Mapped": isinstance(base, np.memmap)})
+        rows.append({"Component": "index", "dtype": str(self.index.dtype), "Shape": (len(self.index),),
+                     "Bytes": self.index.nbytes, "Mapped": False})
+        report = pd.DataFrame(rows)
+        total = {"Component": "total", "dtype": "", "Shape": (len(self.index), len(self.tickers)),
+                 "Bytes": int(report["Bytes"].sum()), "Mapped": bool(report["Mapped"].iloc[:-1].all())}
+        return pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self.columns
+
+    def field(self, name: str) -> np.ndarray:
+        """(timestamps, tickers) array of `name`."""
+        return self.fields[name]
+
+    def series(self, ticker: str, field: str = "Close") -> np.ndarray:
+        """Contiguous view of one ticker's `field`."""
+        return self.fields[field][:, self.columns[ticker]]
+
+    def to_frame(self, field: str = "Close") -> pd.DataFrame:
+        """`field` as a DataFrame with one column per ticker."""
+        return pd.DataFrame(self.fields[field], index=self.index, columns=self.tickers, copy=False)
@@ -0,0 +1,334 @@
+"""
+Market-data providers behind market_data.fetch_candles / fetch_batch_candles.
+
+Every provider downloads OHLCV bars for a list of tickers and returns them
+with (ticker, field) MultiIndex columns, the yf.download(group_by='ticker')
+layout:
+
+- YFinanceProvider: Yahoo Finance through yfinance (the default).
+- SyntheticProvider: deterministic generated panels, any universe size.
+- ReplayProvider: panels recorded to disk from another provider.
+
+The offline providers take a simulated latency (and failure rate), so page
+latency and the fetch engine can be measured without network access.
+"""
+import logging
+import os
+import random
+import time
+import urllib.parse
+import zlib
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src import market_calendar
+from src.candle_store import FIELDS, is_daily_interval
+
+_RESAMPLE_RULES = {"1wk": "W-FRI", "1mo": "MS"}
+_RESAMPLE_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Adj Close": "last", "Volume": "sum"}
+
+
+class MarketDataProvider:
+    """Base class: subclasses implement `download`."""
+
+    name = "base"
+    # Whether the shared ticker rate limit in market_data applies to this provider.
+    rate_limited = False
+
+    def download(self, tickers: list[str], interval: str, period: Optional[str] = None,
+                 start=None, end=None) -> pd.DataFrame:
+        """
+        Bars for `tickers` at `interval`, either for a yfinance `period` or
+        for the [start, end) range (start takes precedence).
+        """
+        raise NotImplementedError
+
+
+# Substrings of yfinance's per-ticker errors that mean the request itself
+# failed (worth retrying), as opposed to Yahoo having no bars for the ticker.
+_TRANSPORT_ERRORS = ("Too Many Requests", "RateLimit", "Connection", "Timeout", "timed out", "HTTPError",
+                     "curl", "SSL", "Max retries", "Remote end closed")
+
+
+class _YFinanceErrors(logging.Handler):
+    """Collects the "['TICKER', ...]: reason" failure lines yf.download logs."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+    def transport_failures(self, tickers: list[str]) -> dict[str, str]:
+        """{ticker: error} of `tickers` whose download failed in transport."""
+        failures = {}
+        for message in self.messages:
+            names, _, reason = message.partition("]: ")
+            if not reason or not any(marker in reason for marker in _TRANSPORT_ERRORS):
+                continue
+            for t in tickers:
+                if f"'{t.upper()}'" in names:
+                    failures[t] = reason
+        return failures
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+    rate_limited = True
+
+    def download(self, tickers, interval, period=None, start=None, end=None):
+        """
+        yfinance reports per-ticker failures as log lines and missing data.
+        Tickers Yahoo has no bars for (delisted, renamed) come back missing,
+        so they are stored as empty partitions; a transport failure (rate
+        limit, connection, timeout) of any ticker is raised to let the caller
+        retry the chunk.
+        """
+        import yfinance as yf
+
+        if start is not None:
+            period = None
+        errors = _YFinanceErrors()
+        # Concurrent chunks share the logger; each keeps only the lines naming its tickers.
+        logger = logging.getLogger("yfinance")
+        logger.addHandler(errors)
+        try:
+            df = yf.download(" ".join(tickers), period=period, start=start, end=end, interval=interval,
+                             group_by='ticker', auto_adjust=False, progress=False)
+        finally:
+            logger.removeHandler(errors)
+        failures = errors.transport_failures(tickers)
+        if failures:
+            ticker, reason = next(iter(failures.items()))
+            raise RuntimeError(f"Download failed for {len(failures)} of {len(tickers)} tickers ({ticker}: {reason})")
+        return df if df is not None else pd.DataFrame()
+
+
+class _SimulatedNetwork(MarketDataProvider):
+    """Latency and failure injection shared by the offline providers."""
+
+    def __init__(self, latency: float = 0.0, latency_per_ticker: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.latency_per_ticker = latency_per_ticker
+        self.failure_rate = failure_rate
+
+    def _simulate_network(self, n_tickers: int):
+        delay = self.latency + self.latency_per_ticker * n_tickers
+        if delay > 0:
+            time.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Simulated provider failure")
+
+
+def _window(period: Optional[str], start, end) -> tuple[Optional[pd.Timestamp], pd.Timestamp]:
+    """Resolves period/start/end into a UTC [start, end) window, `end` capped at now."""
+    now = pd.Timestamp.now(tz="UTC")
+    if start is None:
+        start = market_calendar.period_start(period or "1mo", now)
+    else:
+        start = pd.Timestamp(start)
+        start = start.tz_localize("UTC") if start.tz is None else start
+    end = pd.Timestamp(end) if end is not None else now
+    end = end.tz_localize("UTC") if end.tz is None else end
+    return start, min(end, now)
+
+
+def _clip(frame: pd.DataFrame, start: Optional[pd.Timestamp], end: pd.Timestamp) -> pd.DataFrame:
+    """Rows of `frame` in [start, end), comparing naive indexes against naive UTC bounds."""
+    if frame.index.tz is None:
+        start = start.tz_localize(None) if start is not None else None
+        end = end.tz_localize(None)
+    lo = 0 if start is None else frame.index.searchsorted(start, side="left")
+    hi = frame.index.searchsorted(end, side="left")
+    return frame.iloc[lo:hi]
+
+
+def _hash_uniform(keys: np.ndarray) -> np.ndarray:
+    """splitmix64 of integer keys mapped to [0, 1): noise that depends only on the key."""
+    with np.errstate(over="ignore"):
+        z = keys.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def _hash_normal(keys: np.ndarray) -> np.ndarray:
+    u1 = np.maximum(_hash_uniform(keys * 2), 1e-12)
+    u2 = _hash_uniform(keys * 2 + 1)
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+class SyntheticProvider(_SimulatedNetwork):
+    """
+    Deterministic random-walk OHLCV on the NYSE calendar.
+
+    Daily closes follow a one-factor model (every ticker loads on a shared
+    "market" walk with its own beta), so correlations are non-trivial.
+    Intraday bars bridge consecutive daily closes with key-hashed noise, so a
+    bar has the same value whichever window it is requested in and tail
+    fetches merge cleanly with earlier ones.
+    """
+
+    name = "synthetic"
+    ORIGIN = pd.Timestamp("2015-01-02")
+
+    def __init__(self, seed: int = 0, daily_vol: float = 0.015, intraday_vol: float = 0.004, **network):
+        super().__init__(**network)
+        self.seed = seed
+        self.daily_vol = daily_vol
+        self.intraday_vol = intraday_vol
+
+    @staticmethod
+    def universe(n: int, prefix: str = "SYN") -> list[str]:
+        """`n` synthetic ticker names."""
+        width = len(str(n))
+        return [f"{prefix}{i:0{width}d}" for i in range(n)]
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _days(end: pd.Timestamp) -> pd.DatetimeIndex:
+        return market_calendar.trading_days("NYSE", SyntheticProvider.ORIGIN, end)
+
+    @lru_cache(maxsize=8)
+    def _factor(self, n_days: int) -> np.ndarray:
+        return np.random.default_rng([self.seed, 0]).standard_normal(n_days)
+
+    def _ticker_seed(self, ticker: str) -> int:
+        return zlib.crc32(f"{self.seed}:{ticker}".encode())
+
+    def _log_closes(self, ticker: str, n_days: int) -> np.ndarray:
+        """Log daily closes from ORIGIN over `n_days` sessions."""
+        seed = self._ticker_seed(ticker)
+        rng = np.random.default_rng(seed)
+        beta = rng.uniform(-0.3, 0.9)
+        base = np.log(rng.uniform(10, 500))
+        idio = rng.standard_normal(n_days)
+        returns = self.daily_vol * (beta * self._factor(n_days) + np.sqrt(1 - beta ** 2) * idio)
+        return base + np.cumsum(returns)
+
+    def download(self, tickers, interval, period=None, start=None, end=None):
+        self._simulate_network(len(tickers))
+        start, end = _window(period, start, end)
+        days = self._days(end.tz_localize(None).normalize())
+        daily = is_daily_interval(interval)
+        if daily and interval != "1d" and interval not in _RESAMPLE_RULES:
+            raise ValueError(f"Unsupported interval: {interval}")
+
+        frames = {}
+        for ticker in tickers:
+            log_closes = self._log_closes(ticker, len(days))
+            if daily:
+                frame = self._daily_bars(ticker, days, log_closes)
+                if interval in _RESAMPLE_RULES:
+                    frame = frame.resample(_RESAMPLE_RULES[interval]).agg(_RESAMPLE_AGG).dropna(how="all")
+            else:
+                frame = self._intraday_bars(ticker, days, log_closes, interval, start)
+            frames[ticker] = _clip(frame, start, end)
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+    def _daily_bars(self, ticker: str, days: pd.DatetimeIndex, log_closes: np.ndarray) -> pd.DataFrame:
+        keys = (np.uint64(self._ticker_seed(ticker)) << np.uint64(24)) + np.arange(len(days), dtype=np.uint64)
+        close = np.exp(log_closes)
+        prev = np.concatenate([log_closes[:1], log_closes[:-1]])
+        open_ = np.exp(prev + 0.2 * self.daily_vol * _hash_normal(keys))
+        spread = np.abs(_hash_normal(keys + np.uint64(1 << 22))) * 0.5 * self.daily_vol
+        return pd.DataFrame({
+            "Open": open_,
+            "High": np.maximum(open_, close) * np.exp(spread),
+            "Low": np.minimum(open_, close) * np.exp(-spread),
+            "Close": close,
+            "Adj Close": close,
+            "Volume": np.floor(_hash_uniform(keys + np.uint64(1 << 23)) * 1e6) + 1e3,
+        }, index=pd.DatetimeIndex(days, name="Date"))
+
+    def _intraday_bars(self, ticker: str, days: pd.DatetimeIndex, log_closes: np.ndarray, interval: str,
+                       start: Optional[pd.Timestamp]) -> pd.DataFrame:
+        step = market_calendar.INTERVAL_LENGTHS[interval]
+        # Only generate the sessions that can fall inside the window.
+        first = 1 if start is None else max(1, days.searchsorted(start.tz_localize(None).normalize()))
+        day_pos = np.arange(first, len(days))
+        if len(day_pos) == 0:
+            return pd.DataFrame(columns=FIELDS, dtype="float64", index=pd.DatetimeIndex([], tz="UTC", name="Datetime"))
+
+        sessions = [market_calendar.session_bounds("NYSE", days[p]) for p in day_pos]
+        n_bars = max(1, int((sessions[0][1] - sessions[0][0]) / step))
+        k = np.arange(n_bars)
+        u = (k + 1) / n_bars
+
+        keys = (np.uint64(self._ticker_seed(ticker)) << np.uint64(24)) + \
+            (day_pos[:, None] * n_bars + k[None, :]).astype(np.uint64)
+        prev, cur = log_closes[day_pos - 1][:, None], log_closes[day_pos][:, None]
+        log_close = prev + (cur - prev) * u + self.intraday_vol * np.sqrt(u * (1 - u)) * _hash_normal(keys)
+        log_open = np.concatenate([prev, log_close[:, :-1]], axis=1)
+        spread = np.abs(_hash_normal(keys + np.uint64(1 << 22))).ravel() * 0.3 * self.intraday_vol
+
+        opens = np.array([open_.value for open_, _ in sessions], dtype=np.int64)
+        index = pd.to_datetime((opens[:, None] + k[None, :] * step.value).ravel(), utc=True).rename("Datetime")
+        close = np.exp(log_close).ravel()
+        open_ = np.exp(log_open).ravel()
+        return pd.DataFrame({
+            "Open": open_,
+            "High": np.maximum(open_, close) * np.exp(spread),
+            "Low": np.minimum(open_, close) * np.exp(-spread),
+            "Close": close,
+            "Adj Close": close,
+            "Volume": np.floor(_hash_uniform(keys.ravel() + np.uint64(1 << 23)) * 1e5) + 100,
+        }, index=index)
+
+
+class ReplayProvider(_SimulatedNetwork):
+    """
+    Serves panels recorded with `record()` from `root`, laid out as
+    <root>/<interval>/<ticker>.parquet. Tickers that were not recorded come
+    back missing, like a delisted ticker from Yahoo.
+    """
+
+    name = "replay"
+
+    def __init__(self, root: str = "data/replay", **network):
+        super().__init__(**network)
+        self.root = root
+
+    def _path(self, ticker: str, interval: str) -> str:
+        return os.path.join(self.root, interval, f"{urllib.parse.quote(ticker, safe='')}.parquet")
+
+    def record(self, source: MarketDataProvider, tickers: list[str], interval: str, period: str):
+        """Downloads `tickers` from `source` and writes them for replay."""
+        df = source.download(tickers, interval, period=period)
+        for ticker in tickers:
+            if ticker not in df.columns.get_level_values(0):
+                continue
+            path = self._path(ticker, interval)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df[ticker].dropna(how="all").to_parquet(path)
+
+    def download(self, tickers, interval, period=None, start=None, end=None):
+        self._simulate_network(len(tickers))
+        start, end = _window(period, start, end)
+        frames = {}
+        for ticker in tickers:
+            path = self._path(ticker, interval)
+            if os.path.exists(path):
+                frames[ticker] = _clip(pd.read_parquet(path), start, end)
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+
+def provider_from_env() -> MarketDataProvider:
+    """
+    Provider selected by OPERAR_PROVIDER ('yfinance', 'synthetic' or
+    'replay:<dir>'), with OPERAR_PROVIDER_LATENCY seconds of simulated
+    latency per call for the offline providers. Defaults to yfinance.
+    """
+    spec = os.environ.get("OPERAR_PROVIDER", "yfinance")
+    latency = float(os.environ.get("OPERAR_PROVIDER_LATENCY", "0"))
+    if spec == "synthetic":
+        return SyntheticProvider(latency=latency)
+    if spec.startswith("replay"):
+        _, _, root = spec.partition(":")
+        return ReplayProvider(root or "data/replay", latency=latency)
+    return YFinanceProvider()
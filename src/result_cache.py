@@ -0,0 +1,188 @@
+"""
+Memoization of analysis results, independent of Streamlit.
+
+A result is keyed by the function and its arguments, with PricePanel
+arguments replaced by their content fingerprint, so a rerun over the same
+bars and parameters is a lookup no matter which session, or process, asks.
+
+Two tiers: an in-process byte-bounded LRU (shared by every session of the
+Streamlit process) and pickles under data/cache/results (shared with other
+processes, e.g. the CLI). Both hold pickled results, so every caller gets
+its own copy and may modify it.
+
+Keys are salted with CODE_VERSION, a digest of the source of every module
+in src/ plus CACHE_VERSION, so results stored by an older version of the
+code (a kernel fix, a precision change) are never returned after it
+changes. Bump CACHE_VERSION for changes the sources do not show, such as a
+numpy or pandas upgrade.
+"""
+import functools
+import glob
+import hashlib
+import os
+import pickle
+from typing import Any, Callable, Optional
+
+from src import tracing
+from src.memory_cache import ByteLRUCache, SingleFlight
+from src.price_panel import PricePanel
+
+RESULTS_DIR = "data/cache/results"
+MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+DISK_BUDGET_BYTES = 256 * 1024 * 1024
+CACHE_VERSION = 1
+
+
+def _code_version() -> str:
+    """Digest of CACHE_VERSION and the source of every module of this package."""
+    h = hashlib.blake2b(str(CACHE_VERSION).encode(), digest_size=8)
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as f:
+            h.update(os.path.basename(path).encode())
+            h.update(f.read())
+    return h.hexdigest()
+
+
+CODE_VERSION = _code_version()
+
+
+def _key_part(value: Any):
+    """Hashable, process-independent stand-in for an argument."""
+    if isinstance(value, PricePanel):
+        return ("PricePanel", value.fingerprint)
+    if isinstance(value, (list, tuple, range)):
+        return tuple(_key_part(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _key_part(v)) for k, v in value.items()))
+    return value
+
+
+def result_key(name: str, args: tuple, kwargs: dict) -> str:
+    """Digest of a call: code version, function name, positional and keyword arguments."""
+    key = (CODE_VERSION, name, _key_part(args), _key_part(kwargs))
+    return hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """Pickled results by key, in memory and (optionally) on disk."""
+
+    def __init__(self, max_bytes: int = MEMORY_BUDGET_BYTES, directory: Optional[str] = RESULTS_DIR,
+                 disk_budget_bytes: int = DISK_BUDGET_BYTES):
+        self.directory = directory
+        self.disk_budget_bytes = disk_budget_bytes
+        self._memory = ByteLRUCache(max_bytes)
+        self._in_flight = SingleFlight()
+        self.disk_hits = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _load(self, key: str) -> Optional[bytes]:
+        blob = self._memory.get(key)
+        if blob is not None or self.directory is None:
+            return blob
+        try:
+            with open(self._path(key), "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        self.disk_hits += 1
+        tracing.count("result_cache.disk_hits")
+        self._memory.put(key, blob, len(blob))
+        return blob
+
+    def _store(self, key: str, blob: bytes):
+        self._memory.put(key, blob, len(blob))
+        if self.directory is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written under a unique name and renamed, so other processes never read a partial file.
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, self._path(key))
+            self._evict_to_budget()
+        except OSError as e:
+            print(f"Error writing result {key}: {e}")
+
+    def _evict_to_budget(self):
+        """Deletes least recently written results until the directory fits its budget."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_budget_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Returns a copy of the result stored under `key`, computing and storing
+        it first on a miss. Concurrent misses on the same key compute once.
+        """
+        blob = self._load(key)
+        if blob is None:
+            def load():
+                blob = self._load(key)
+                if blob is None:
+                    tracing.count("result_cache.misses")
+                    blob = pickle.dumps(compute(), protocol=pickle.HIGHEST_PROTOCOL)
+                    self._store(key, blob)
+                return blob
+            blob = self._in_flight.do(key, load)
+        else:
+            tracing.count("result_cache.hits")
+        tracing.count("result_cache.bytes_read", len(blob))
+        with tracing.span("result_cache.unpickle"):
+            return pickle.loads(blob)
+
+    def clear(self):
+        """Empties both tiers."""
+        self._memory.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                try:
+                    os.unlink(entry.path)
+                except OSError as e:
+                    print(f"Error deleting {entry.path}: {e}")
+
+    def stats(self) -> dict:
+        stats = self._memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["coalesced"] = self._in_flight.coalesced
+        return stats
+
+
+_results = ResultCache()
+
+
+def memoize(fn: Callable) -> Callable:
+    """
+    Caches `fn`'s results in the shared ResultCache. Arguments must be
+    PricePanels or values with a stable repr (numbers, strings, lists...).
+    """
+    name = f"{fn.__module__}.{fn.__qualname__}"
+    compute = tracing.traced(fn)  # spans only the calls that miss
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = result_key(name, args, kwargs)
+        return _results.get_or_compute(key, lambda: compute(*args, **kwargs))
+
+    return wrapper
+
+
+def cache_stats() -> dict:
+    return _results.stats()
+
+
+def clear_results():
+    _results.clear()
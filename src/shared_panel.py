@@ -0,0 +1,151 @@
+"""
+PricePanels shared between sessions and processes through memory maps.
+
+A panel is published as fixed-layout .npy files, one column-major array
+per field plus the valid mask, under
+
+    data/cache/panels/<panel key>/<version>/
+
+and every process maps those files read-only, so the operating system
+keeps one copy of the bars in its page cache however many Streamlit
+sessions, workers or CLI runs read them. The version is derived from the
+catalog state of the panel's partitions; when new bars land, a new version
+directory is written and the panel's CURRENT file is swapped to it with an
+atomic rename. Readers that already mapped the old version keep a valid
+mapping until they drop it.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src import catalog, tracing
+from src.memory_cache import SingleFlight
+from src.price_panel import PricePanel
+
+PANELS_DIR = "data/cache/panels"
+# Versions kept per panel besides the current one, for readers still mapping them.
+KEEP_VERSIONS = 1
+# Panels not published or read for this long are deleted on the next publish.
+MAX_IDLE_SECONDS = 7 * 24 * 3600
+
+_CURRENT = "CURRENT"
+_in_flight = SingleFlight()
+
+
+def panel_key(tickers: list[str], interval: str, fields: Optional[list[str]], start,
+              precision: str = "float64") -> str:
+    """Directory name of the panel of `tickers` at `interval` from `start`."""
+    key = (tuple(tickers), interval, tuple(fields) if fields is not None else None,
+           pd.Timestamp(start).isoformat() if start is not None else None, precision)
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+
+def _current(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, _CURRENT)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def open_version(path: str) -> PricePanel:
+    """Maps a published panel version read-only (only the index is copied)."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    index = pd.DatetimeIndex(np.load(os.path.join(path, "index.npy")), name=meta["index_name"])
+    if meta["tz"] is not None:
+        index = index.tz_localize("UTC").tz_convert(meta["tz"])
+    fields = {f: np.load(os.path.join(path, f"{f}.npy"), mmap_mode="r") for f in meta["fields"]}
+    valid = np.load(os.path.join(path, "valid.npy"), mmap_mode="r")
+    return PricePanel(index, meta["tickers"], fields, valid=valid)
+
+
+def publish(directory: str, version: str, panel: PricePanel) -> str:
+    """
+    Writes `panel` as a new version of the panel in `directory` and makes it
+    current. Returns the path of the version.
+    """
+    name = f"{version}-{os.getpid()}-{threading.get_ident()}"
+    tmp = os.path.join(directory, f".{name}.tmp")
+    os.makedirs(tmp, exist_ok=True)
+    index = panel.index
+    np.save(os.path.join(tmp, "index.npy"), index.asi8)  # UTC nanoseconds when tz-aware
+    for f, values in panel.fields.items():
+        np.save(os.path.join(tmp, f"{f}.npy"), np.asfortranarray(values))
+    np.save(os.path.join(tmp, "valid.npy"), np.asfortranarray(panel.valid))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"tickers": panel.tickers, "fields": list(panel.fields), "index_name": index.name,
+                   "tz": str(index.tz) if index.tz is not None else None}, f)
+
+    path = os.path.join(directory, name)
+    os.replace(tmp, path)
+    current_tmp = os.path.join(directory, f".{_CURRENT}.{name}.tmp")
+    with open(current_tmp, "w") as f:
+        f.write(name)
+    os.replace(current_tmp, os.path.join(directory, _CURRENT))
+    _prune(directory, name)
+    return path
+
+
+def _prune(directory: str, current: str):
+    """Deletes old versions of one panel and panels nobody has used lately."""
+    versions = sorted((e for e in os.scandir(directory) if e.is_dir() and not e.name.startswith(".")
+                       and e.name != current), key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+    cutoff = time.time() - MAX_IDLE_SECONDS
+    for entry in os.scandir(PANELS_DIR):
+        try:
+            idle = entry.is_dir() and os.stat(os.path.join(entry.path, _CURRENT)).st_mtime < cutoff
+        except OSError:
+            continue
+        if idle:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def load(tickers: list[str], interval: str, fields: Optional[list[str]], start,
+         build: Callable[[], PricePanel], precision: str = "float64") -> PricePanel:
+    """
+    The shared panel of `tickers` at `interval` from `start`: the current
+    published version if it matches the catalog state of their partitions,
+    otherwise `build()` published as a new version. Either way the returned
+    panel is backed by the shared maps. Falls back to the private panel from
+    `build()` if publishing fails.
+    """
+    directory = os.path.join(PANELS_DIR, panel_key(tickers, interval, fields, start, precision))
+    version = catalog.version(tickers, interval)
+
+    def load_version():
+        current = _current(directory)
+        if current is not None and current.split("-", 1)[0] == version:
+            try:
+                panel = open_version(os.path.join(directory, current))
+                os.utime(os.path.join(directory, _CURRENT))
+                tracing.count("shared_panel.mapped")
+                return panel
+            except (OSError, ValueError, KeyError) as e:
+                tracing.error(f"Error mapping panel {current}: {e}")
+        tracing.count("shared_panel.built")
+        panel = build()
+        try:
+            with tracing.span("shared_panel.publish", bytes=panel.nbytes):
+                return open_version(publish(directory, version, panel))
+        except (OSError, ValueError) as e:
+            tracing.error(f"Error publishing panel {directory}: {e}")
+            return panel
+
+    return _in_flight.do((directory, version), load_version)
+
+
+def clear_panels():
+    """Deletes every published panel."""
+    if os.path.exists(PANELS_DIR):
+        shutil.rmtree(PANELS_DIR, ignore_errors=True)
@@ -0,0 +1,49 @@
+"""
+Last-known-good snapshot of the daily Close panel.
+
+After every successful load the page stores its daily Close panel as one
+small uncompressed .npz file, so a cold process can render the performance
+tables from it immediately (no store sync, no network) while fresh data
+loads, then swap them for the fresh ones.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.price_panel import PricePanel
+
+SNAPSHOT_PATH = "data/cache/snapshot/daily_close.npz"
+
+
+def save_snapshot(panel: PricePanel, path: str = SNAPSHOT_PATH):
+    """Stores the Close field of `panel`, written to a temporary file and renamed into place."""
+    if panel is None or panel.empty or "Close" not in panel.fields:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(tmp, index=panel.index.asi8, tz=np.array(str(panel.index.tz) if panel.index.tz else ""),
+                 tickers=np.array(panel.tickers, dtype=str), close=np.asarray(panel.field("Close")),
+                 saved_at=np.array(pd.Timestamp.now(tz="UTC").value))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Error saving snapshot {path}: {e}")
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[tuple[PricePanel, pd.Timestamp]]:
+    """(Close panel, saved at) of the last snapshot, or None if there is none."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            index = pd.DatetimeIndex(data["index"])
+            tz = str(data["tz"])
+            if tz:
+                index = index.tz_localize("UTC").tz_convert(tz)
+            panel = PricePanel(index, data["tickers"].tolist(), {"Close": data["close"]})
+            saved_at = pd.Timestamp(int(data["saved_at"]), tz="UTC")
+    except (OSError, KeyError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Error loading snapshot {path}: {e}")
+        return None
+    return panel, saved_at
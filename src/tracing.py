@@ -0,0 +1,234 @@
+"""
+Lightweight tracing of the data and analysis hot paths.
+
+market_data, analysis and the caches wrap their expensive steps in spans
+(timed, nested) and bump counters (cache hits and misses, bytes read, rows
+fetched). Events go to:
+
+- the current Recording, which collects the events of one unit of work
+  (the page starts one per rerun) and summarizes them per span and counter;
+- every registered sink, e.g. a JsonlSink appending each event as one JSON
+  line for offline analysis. OPERAR_TRACE=<path> registers one at import.
+
+With no recording and no sink, a span or counter is a context-variable
+lookup and nothing else.
+
+    with tracing.recording() as rec:
+        analysis.calculate_correlations(tickers)
+    print(rec.spans())
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+# Events kept per recording; a rerun emits a few hundred.
+MAX_EVENTS = 20_000
+
+
+class TraceSink:
+    """Receives every event of every thread, as a JSON-ready dict."""
+
+    def emit(self, event: dict):
+        raise NotImplementedError
+
+
+class JsonlSink(TraceSink):
+    """Appends events to `path`, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", buffering=1)
+
+    def emit(self, event: dict):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Recording:
+    """Events of one unit of work, in the order they finished."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = []
+        self.dropped = 0
+
+    def add(self, event: dict):
+        if len(self.events) < MAX_EVENTS:
+            self.events.append(event)
+        else:
+            self.dropped += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def spans(self) -> pd.DataFrame:
+        """Per span name: calls, total and self time (total minus child spans), slowest first."""
+        rows = [e for e in self.events if e["type"] == "span"]
+        if not rows:
+            return pd.DataFrame(columns=["Span", "Calls", "Total ms", "Self ms"])
+        df = pd.DataFrame(rows)
+        summary = df.groupby("name").agg(Calls=("seconds", "size"), Total=("seconds", "sum"),
+                                         Self=("self_seconds", "sum"))
+        summary[["Total", "Self"]] *= 1000
+        summary = summary.rename(columns={"Total": "Total ms", "Self": "Self ms"}).rename_axis("Span")
+        return summary.sort_values("Total ms", ascending=False).reset_index()
+
+    def counters(self) -> pd.DataFrame:
+        """Per counter name: the sum of its increments."""
+        rows = [e for e in self.events if e["type"] == "counter"]
+        if not rows:
+            return pd.DataFrame(columns=["Counter", "Value"])
+        df = pd.DataFrame(rows).groupby("name")["value"].sum().rename("Value").rename_axis("Counter")
+        return df.reset_index()
+
+    def errors(self) -> list[str]:
+        return [e["message"] for e in self.events if e["type"] == "error"]
+
+    def to_jsonl(self) -> str:
+        return "".join(json.dumps(e, default=str) + "\n" for e in self.events)
+
+
+_sinks: list[TraceSink] = []
+_current: contextvars.ContextVar[Optional[Recording]] = contextvars.ContextVar("trace_recording", default=None)
+_parent: contextvars.ContextVar[Optional["span"]] = contextvars.ContextVar("trace_parent", default=None)
+
+
+def add_sink(sink: TraceSink):
+    _sinks.append(sink)
+
+
+def remove_sink(sink: TraceSink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def _emit(event: dict):
+    recording = _current.get()
+    if recording is not None:
+        recording.add(event)
+    for sink in list(_sinks):
+        try:
+            sink.emit(event)
+        except Exception as e:
+            print(f"Error emitting trace event to {sink!r}: {e}")
+
+
+def enabled() -> bool:
+    """Whether events of the current context go anywhere."""
+    return bool(_sinks) or _current.get() is not None
+
+
+def start_recording() -> Recording:
+    """Collects the events of the current context (and the threads it hands work to) in a new Recording."""
+    recording = Recording()
+    _current.set(recording)
+    return recording
+
+
+class recording:
+    """Context manager: a Recording of the events inside the block."""
+
+    def __enter__(self) -> Recording:
+        self._recording = Recording()
+        self._token = _current.set(self._recording)
+        return self._recording
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+
+
+class span:
+    """
+    Times the block as one event named `name`, with `attrs` attached. Spans
+    nest: a span's self time excludes the spans opened inside it on the
+    same thread.
+    """
+
+    __slots__ = ("name", "attrs", "_start", "_wall", "_token", "_children", "_thread")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._start = None
+
+    def __enter__(self):
+        if not enabled():
+            return self
+        self._children = 0.0
+        self._thread = threading.get_ident()
+        self._token = _parent.set(self)
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is None:
+            return
+        seconds = time.perf_counter() - self._start
+        _parent.reset(self._token)
+        parent = _parent.get()
+        if parent is not None and parent._thread == self._thread:
+            parent._children += seconds
+        event = {"type": "span", "name": self.name, "ts": self._wall, "seconds": seconds,
+                 "self_seconds": max(0.0, seconds - self._children),
+                 "parent": parent.name if parent is not None else None, "thread": self._thread}
+        if exc_type is not None:
+            event["error"] = f"{exc_type.__name__}: {exc}"
+        event.update(self.attrs)
+        _emit(event)
+
+
+def traced(fn: Optional[Callable] = None, *, name: Optional[str] = None) -> Callable:
+    """Decorator: every call of the function is a span (named module.function by default)."""
+    def decorate(fn):
+        span_name = name or f"{fn.__module__.removeprefix('src.')}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate(fn) if fn is not None else decorate
+
+
+def count(name: str, value: float = 1, **attrs):
+    """Adds `value` to the counter `name`."""
+    if not enabled():
+        return
+    event = {"type": "counter", "name": name, "value": value, "ts": time.time()}
+    event.update(attrs)
+    _emit(event)
+
+
+def error(message: str, **attrs):
+    """Prints `message` as before and records it as an error event."""
+    print(message)
+    if enabled():
+        event = {"type": "error", "name": "error", "message": message, "ts": time.time()}
+        event.update(attrs)
+        _emit(event)
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """`fn` running in a copy of the current context, so work handed to a pool thread is traced with its caller."""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+if os.environ.get("OPERAR_TRACE"):
+    add_sink(JsonlSink(os.environ["OPERAR_TRACE"]))
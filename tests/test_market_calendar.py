@@ -0,0 +1,16 @@
+from src import market_calendar
+
+
+def test_new_year_on_saturday_is_not_observed_on_friday():
+    assert market_calendar.is_trading_day("NYSE", "2021-12-31")
+    assert market_calendar.is_trading_day("NYSE", "2027-12-31")
+    assert not market_calendar.is_trading_day("NYSE", "2022-01-01")
+
+
+def test_first_monday_after_saturday_new_year_trades():
+    assert market_calendar.is_trading_day("NYSE", "2022-01-03")
+
+
+def test_new_year_on_sunday_is_observed_on_monday():
+    assert not market_calendar.is_trading_day("NYSE", "2023-01-02")
+    assert market_calendar.is_trading_day("NYSE", "2022-12-30")